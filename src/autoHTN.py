@@ -3,12 +3,22 @@ import itertools
 import pyhop
 import json
 
+import codegen
+from inventory import CompactState, item_index
+from recipes import RecipeGraph, op_name
+
 
 def check_enough(state, ID, item, num):
     if getattr(state, item)[ID] >= num: return []
     return False
 
 
+# check_enough for a CompactState: reads the slot straight out of the array instead of going through a column view
+def compact_check_enough(state, ID, item, num):
+    if state.values[state.rows[ID] + state.index[item]] >= num: return []
+    return False
+
+
 def produce_enough(state, ID, item, num):
     return [('produce', ID, item), ('have_enough', ID, item, num)]
 
@@ -23,31 +33,36 @@ def produce(state, ID, item):
 pyhop.declare_methods('produce', produce)
 
 
-# Creates a method for each recipe in the json file given the name and the rule. The method will be called the name of the recipe.
-# The method will return a list of tasks that need to be done to complete the recipe. NO OPS HERE
-def make_method(name, rule):
-    def method(state, ID):
-        # Create a list of tasks that need to be done to complete the recipe
-        tasks = []
+# Lifted versions of produce_enough and produce: everything that is missing is produced by one decomposition, and
+# the recipe methods from make_lifted_method work out how many times to run their recipe. Like produce_enough, it
+# makes at least one more when backtracking reaches it with enough already there
+def produce_missing(state, ID, item, num):
+    return [('produce', ID, item, max(num - getattr(state, item)[ID], 1)), ('have_enough', ID, item, num)]
 
-        # I JUST REALIZED THAT WE CAN MAKE THIS SO MUCH BETTER
-        crafting_order = ['ingot', 'coal', 'ore', 'cobble', 'stick', 'plank', 'wood']
 
-        # Loop through any of the "Requires" items and call check_enough on them
-        if 'Requires' in rule:
-            # Loop through any of the "Requires" items and call have_enough on them
-            for item, num in rule['Requires'].items():
-                tasks.append(('have_enough', ID, item, num))
+def produce_count(state, ID, item, missing):
+    return [('produce_{}'.format(item), ID, missing)]
 
-        # Check the consumed items in the order in which they are crafted
-        if 'Consumes' in rule:
-            for item in crafting_order:
-                if item in rule['Consumes']:
-                    tasks.append(('have_enough', ID, item, rule['Consumes'][item]))
 
-        # Call the op method for the recipe name if it all checks out
-        tasks.append(('op_' + str(name).replace(" ", "_"), ID))
+# Creates a method for each recipe in the json file given the name and the rule. The method will be called the name of the recipe.
+# The method will return a list of tasks that need to be done to complete the recipe. NO OPS HERE
+# consume_order is the order to gather consumed items in, normally RecipeGraph.consume_order (highest tier first)
+def make_method(name, rule, consume_order=None):
+    # Everything but the agent ID is known up front, so work out the (item, num) pairs once instead of on every call
+    requires = list(rule.get('Requires', {}).items())
+    consumes = rule.get('Consumes', {})
+    if consume_order is not None:
+        consumes = [(item, consumes[item]) for item in consume_order if item in consumes]
+    else:
+        consumes = list(consumes.items())
+    op = op_name(name)
 
+    def method(state, ID):
+        # have_enough every "Requires" item, then every "Consumes" item in the order in which they are crafted, then
+        # call the op method for the recipe name if it all checks out
+        tasks = [('have_enough', ID, item, num) for item, num in requires]
+        tasks.extend(('have_enough', ID, item, num) for item, num in consumes)
+        tasks.append((op, ID))
         return tasks
 
     # Tag the function with the item it produces
@@ -62,20 +77,52 @@ def make_method(name, rule):
     return method
 
 
-def declare_methods(data):
-    method_list = []
+# make_method for lifted planning: the method takes how many units are missing, and gathers the inputs for
+# ceil(missing / produced) runs of the recipe before running it that many times in a single (op, ID, count) step
+def make_lifted_method(name, rule, consume_order=None):
+    requires = list(rule.get('Requires', {}).items())
+    consumes = rule.get('Consumes', {})
+    if consume_order is not None:
+        consumes = [(item, consumes[item]) for item in consume_order if item in consumes]
+    else:
+        consumes = list(consumes.items())
+    op = op_name(name)
+    produced = next(iter(rule['Produces'].values()))
+
+    def method(state, ID, missing=1):
+        count = -(-missing // produced)
+        tasks = [('have_enough', ID, item, num) for item, num in requires]
+        tasks.extend(('have_enough', ID, item, num * count) for item, num in consumes)
+        tasks.append((op, ID) if count == 1 else (op, ID, count))
+        return tasks
 
-    #Create a method for each recipe in the json file
-    for recipe_name, recipe_data in data['Recipes'].items():
-        method_list.append(make_method(recipe_name, recipe_data))
+    method.produces = next(iter(rule['Produces']))
+    method.time = rule['Time']
+    method.__name__ = str(name).replace(" ", "_")
 
-    # Sort the methods by the item they produce and then by the time it takes to produce
-    method_list.sort(key=lambda method: (method.produces, method.time))
+    return method
 
-    # Declare the methods to pyhop. Any methods that produce the same item should be declared together. Apparently
-    # groupby is just a thing that exists? Awesome. https://www.geeksforgeeks.org/itertools-groupby-in-python/
-    for key, group in itertools.groupby(method_list, key=lambda recipe: recipe.produces):
-        pyhop.declare_methods("produce_" + key, *group)
+
+# compact=True pairs with declare_operators(data, index) and a CompactState. graph is a RecipeGraph(data), built if
+# it isn't passed in. Methods go to domain (a pyhop.Domain), or to pyhop's default domain if it is None.
+# compiled=True uses the generated methods from codegen.compile_method instead of make_method. lifted=True declares
+# the lifted methods instead, for operators declared with lifted=True
+def declare_methods(data, compact=False, graph=None, domain=None, compiled=False, lifted=False):
+    domain = domain or pyhop.default_domain
+    domain.declare_methods('have_enough', compact_check_enough if compact else check_enough,
+                           produce_missing if lifted else produce_enough)
+    domain.declare_methods('produce', produce_count if lifted else produce)
+
+    graph = graph or RecipeGraph(data)
+    if lifted:
+        build = make_lifted_method
+    else:
+        build = codegen.compile_method if compiled else make_method
+
+    # The graph already lists each item's producers fastest first, so declare them to pyhop in that order
+    for item, recipe_names in graph.producers.items():
+        domain.declare_methods("produce_" + item,
+                              *[build(name, graph.recipes[name], graph.consume_order) for name in recipe_names])
 
 
 def make_operator(rule):
@@ -117,107 +164,377 @@ def make_operator(rule):
     return operator
 
 
-def declare_operators(data):
+# Same recipe semantics as make_operator, but for a CompactState built with the same index. Requires and Consumes are
+# folded into one (slot, minimum) vector and Consumes/Produces/Time into one (slot, delta) vector, so each call is two
+# flat loops over one agent's row
+def make_compact_operator(rule, index):
+    minimums = {index['time']: rule['Time']}
+    for item, num in itertools.chain(rule.get('Requires', {}).items(), rule.get('Consumes', {}).items()):
+        minimums[index[item]] = max(minimums.get(index[item], 0), num)
+
+    deltas = {index['time']: -rule['Time']}
+    for item, num in rule.get('Consumes', {}).items():
+        deltas[index[item]] = deltas.get(index[item], 0) - num
+    for item, num in rule['Produces'].items():
+        deltas[index[item]] = deltas.get(index[item], 0) + num
+
+    minimums = tuple(minimums.items())
+    deltas = tuple((slot, num) for slot, num in deltas.items() if num)
+
+    def operator(state, ID):
+        values = state.values
+        row = state.rows[ID]
+
+        for slot, num in minimums:
+            if values[row + slot] < num:
+                return False
+
+        for slot, num in deltas:
+            values[row + slot] += num
+
+        return state
+
+    operator.produces = next(iter(rule['Produces']))
+    operator.time = rule['Time']
+
+    return operator
+
+
+# Runs operator count times as one step, for the (op, ID, count) steps of lifted plans. pyhop copies or journals the
+# state before every operator, so a run that fails part of the way through leaves nothing behind
+def make_repeated_operator(operator):
+    def repeated(state, ID, count=1):
+        for _ in range(count):
+            if operator(state, ID) is False:
+                return False
+        return state
+
+    repeated.__name__ = operator.__name__
+    repeated.produces = operator.produces
+    repeated.time = operator.time
+
+    return repeated
+
+
+# Pass the index from item_index(data) to declare operators that only work on a CompactState. compiled=True uses the
+# generated operators from codegen.compile_operator instead of the closures. lifted=True declares them through
+# make_repeated_operator, for the methods declared with lifted=True
+def declare_operators(data, index=None, domain=None, compiled=False, lifted=False):
     operator_list = []
 
     # Create an operator for each recipe in the json file
     for recipe_name, recipe_data in data['Recipes'].items():
-        temp_operator = make_operator(recipe_data)
-
-        #I can't pass the name without changing the sig, so....
-        temp_operator.__name__ = 'op_' + str(recipe_name).replace(" ", "_")
+        if compiled:
+            temp_operator = codegen.compile_operator(recipe_name, recipe_data, index)
+        else:
+            if index is None:
+                temp_operator = make_operator(recipe_data)
+            else:
+                temp_operator = make_compact_operator(recipe_data, index)
+
+            #I can't pass the name without changing the sig, so....
+            temp_operator.__name__ = op_name(recipe_name)
+
+        if lifted:
+            temp_operator = make_repeated_operator(temp_operator)
         operator_list.append(temp_operator)
 
     # Declare the operators to pyhop
-    pyhop.declare_operators(*operator_list)
+    (domain or pyhop.default_domain).declare_operators(*operator_list)
+
+
+# This thing loves to make tools so lets make sure we only actually make them if they are useful.
+# I had chatGPT help me come up with how I should check these and the values for them. I could probably have done the math but they seem to work?
+# https://chatgpt.com/share/28db628e-4fed-4701-b15c-025bf079b80c
+# I've changed this a lot since then but the core idea is still the same
+# For each tool: how much each unit of pending demand for an item counts towards the tool, and the total at or below
+# which it isn't worth making. We don't need one for the wooden pick because it is the only way to get cobble n stuff
+TOOL_PAYOFF = {
+    'iron_pickaxe': ({'coal': 1, 'ingot': 2, 'cobble': 1}, 18),  # Seems to be a good amount of time saved. idk
+    'stone_pickaxe': ({'cobble': 1}, 7),  # If you have 7, then you are about to get a furnace. Just make a pick at that point
+    'wooden_axe': ({'wood': 1}, 10),  # This was just a guess tbh
+    'stone_axe': ({'wood': 1}, 12),
+    'iron_axe': ({'wood': 1}, 20),
+}
 
 
-def add_heuristic(data, ID):
+# The heuristic prunes a task that has been called this many times in a row
+MAX_REPETITIONS = 10
+
+
+def add_heuristic(data, ID, domain=None):
     # prune search branch if heuristic() returns True
     # do not change parameters to heuristic(), but can add more heuristic functions with the same parameters:
     # e.g. def heuristic2(...); pyhop.add_check(heuristic2)
-    def heuristic(state, curr_task, tasks, plan, depth, calling_stack):
-
-        # Trim if we are about to hit the recursion limit because that keeps happening
-        if depth > 900:
-            return True
+    tools = set(data['Tools'])
+    goals = set(data['Goal'])
+    max_repetitions = MAX_REPETITIONS
 
-        # This thing loves to make tools so lets make sure we only actually make them if they are useful.
-        # I had chatGPT help me come up with how I should check these and the values for them. I could probably have done the math but they seem to work?
-        # https://chatgpt.com/share/28db628e-4fed-4701-b15c-025bf079b80c
-        # I've changed this a lot since then but the core idea is still the same
+    def heuristic(state, curr_task, tasks, plan, depth, calling_stack):
         if curr_task[0] == 'produce':
             item_produced = curr_task[2]
-            goals = data['Goal'].keys()
 
             # Ensure that we only make one of each tool
-            if item_produced in data['Tools']:
-                if curr_task in calling_stack:
-                    return True
+            if item_produced in tools and curr_task in calling_stack:
+                return True
 
             # Don't trim if the goal is a tool or it'll never make it
             if item_produced in goals:
                 return False
 
-            if item_produced == 'iron_pickaxe':
-
-                time_saved = {
-                    "coal": 1,
-                    "ingot": 2,
-                    "cobble": 1,
-                }
+            if item_produced in TOOL_PAYOFF:
+                # tasks keeps the pending have_enough amounts summed by item, so this doesn't scan the tasks
+                weights, threshold = TOOL_PAYOFF[item_produced]
+                demand = sum(weight * tasks.total('have_enough', ID, item) for item, weight in weights.items())
 
-                # run through everything and calculate the time saved
-                time_saved_total = 0
-                for task in filter(lambda task: task[0] == 'have_enough' and task[2] in time_saved.keys(), tasks):
-                    time_saved_total += time_saved[task[2]] * task[3]
-
-                # Check to see if we are gonna mine enough for it to matter
-                if time_saved_total <= 18:  # Seems to be a good amount of time saved. idk
-                    return True
-
-            if item_produced == 'stone_pickaxe':
-                # This one is a lot easier to make so we should almost always do it. Just make it if we need to mine more than a small amount
-                required_mining = sum(
-                    task[3] for task in filter(lambda task: task[0] == 'have_enough' and task[2] in {'cobble'}, tasks))
-                if required_mining <= 7:  # If you have 7, then you are about to get a furnace. Just make a pick at that point
-                    return True
-
-            # We don't need one for the wooden pick because it is the only way to get cobble n stuff
-
-            if item_produced in ('wooden_axe', 'stone_axe'):
-                required_wood = sum(task[3] for task in
-                                    filter(lambda task: task[0] == 'have_enough' and task[2] in {'wood', 'planks'},
-                                           tasks))
-                if required_wood <= 10 or (
-                        required_wood <= 12 and item_produced == 'stone_axe'):  #  This was just a guess tbh
-                    return True
-
-            if item_produced == 'iron_axe':
-                required_wood = sum(task[3] for task in
-                                    filter(lambda task: task[0] == 'have_enough' and task[2] in {'wood', 'planks'},
-                                           tasks))
-
-                if required_wood <= 20:
+                # Check to see if we are gonna use it enough for it to matter
+                if demand <= threshold:
                     return True
 
         # Don't try to do the same thing over and over again - doesn't work well
-        max_repetitions = 10
-        if len(calling_stack) > max_repetitions:
-            last_tasks = calling_stack[-max_repetitions:]
-            same_task_repeated = True
-            for task in last_tasks:
-                if task != curr_task:
-                    same_task_repeated = False
-                    break
-            if same_task_repeated:
-                return True
-
-    pyhop.add_check(heuristic)
+        if len(calling_stack) > max_repetitions and calling_stack[-1] == curr_task and \
+                calling_stack.run >= max_repetitions:
+            return True
 
+    (domain or pyhop.default_domain).add_check(heuristic)
+
+
+# Cost of an action for pyhop.pyhop_optimal: the Time of its recipe, times its count for a lifted (op, ID, count)
+def make_action_time(data):
+    times = {op_name(name): rule['Time'] for name, rule in data['Recipes'].items()}
+
+    def action_time(task):
+        return times[task[0]] * task[2] if len(task) > 2 else times[task[0]]
+
+    return action_time
+
+
+# The plan with every lifted (op, ID, count) step written out as count (op, ID) steps
+def expand_plan(plan):
+    expanded = []
+    for task in plan:
+        expanded.extend([task[:2]] * task[2] if len(task) > 2 else [task])
+    return expanded
+
+
+# Lower bound on the time still needed for tasks, for pyhop.pyhop_optimal. It is the larger of two bounds, each of
+# which never overestimates:
+# - every pending op costs its Time, and every unit an open have_enough is still missing costs at least the cheapest
+#   Time per unit of a recipe that makes it (pending ops and produce tasks are credited with what they make)
+# - for whichever set of tools the rest of the plan ends up making, the goal and those tools are worth their
+#   RecipeGraph.unit_values, and the plan has to make up the difference from what is held now. Tools that open tasks
+#   still ask for have to be among the ones it makes. Only what no recipe consumes is sure to still be held at the end,
+#   so the rest of the goal isn't counted
+def make_time_bound(data, ID, graph=None):
+    graph = graph or RecipeGraph(data)
+    recipes = {op_name(name): rule for name, rule in data['Recipes'].items()}
+    tools = data['Tools']
+    items = [item for item in data['Items'] if item not in tools]
+    names = items + list(tools)
+
+    # Every item and tool ID holds in state, read once per bound
+    def amounts(state):
+        if isinstance(state, CompactState):
+            values, row, index = state.values, state.rows[ID], state.index
+            return {name: values[row + index[name]] for name in names}
+        return {name: getattr(state, name)[ID] for name in names}
+
+    # For every set of tools owned now, the (tools made, goal value, item values) of every set of tools it could grow to
+    potentials = {}
+
+    def tool_potentials(owned):
+        if owned not in potentials:
+            options = []
+            missing = [tool for tool in tools if tool not in owned]
+            for size in range(len(missing) + 1):
+                for made in itertools.combinations(missing, size):
+                    if any(tool in data['Goal'] and tool not in owned and tool not in made for tool in tools):
+                        continue
+                    values = graph.unit_values[owned.union(made)]
+                    goal_value = sum(values[tool] for tool in made if tool not in graph.consumed)
+                    goal_value += sum(values[item] * num for item, num in data['Goal'].items()
+                                      if item in items and item not in graph.consumed)
+                    if goal_value < float('inf'):
+                        options.append((frozenset(made), goal_value, tuple(values[item] for item in items)))
+            # Cheapest first, so that potential_bound can usually stop early
+            potentials[owned] = sorted(options, key=lambda option: option[1])
+        return potentials[owned]
+
+    def task_bound(counts, tasks):
+        bound = 0
+        supply = {}
+        need = {}
+        for task in tasks:
+            if task[0] in recipes:
+                rule = recipes[task[0]]
+                count = task[2] if len(task) > 2 else 1
+                bound += rule['Time'] * count
+                for item, num in rule['Produces'].items():
+                    supply[item] = supply.get(item, 0) + num * count
+            elif task[0] == 'have_enough':
+                need[task[2]] = max(need.get(task[2], 0), task[3])
+            elif task[0] == 'produce' or task[0].startswith('produce_'):
+                # A lifted task making missing units can overshoot by less than one run of its recipe
+                if task[0] == 'produce':
+                    item, missing = task[2], task[3] if len(task) > 3 else 1
+                else:
+                    item, missing = task[0][len('produce_'):], task[2] if len(task) > 2 else 1
+                supply[item] = supply.get(item, 0) + graph.most_produced.get(item, 0) + missing - 1
+
+        for item, num in need.items():
+            missing = num - counts[item] - supply.get(item, 0)
+            if missing > 0:
+                bound += missing * graph.step_time.get(item, float('inf'))
+
+        return bound
+
+    # Bounds already worked out, by (tools owned, tools wanted, nonzero (item, count) pairs held)
+    bounds = {}
+
+    # With a limit, stops as soon as it finds that the bound is no more than limit, and returns a value that is
+    def potential_bound(counts, tasks, limit=None):
+        owned = frozenset(tool for tool in tools if counts[tool] > 0)
+        wanted = frozenset(task[2] for task in tasks
+                           if task[0] in ('have_enough', 'produce') and task[2] in tools and task[2] not in owned)
+        held = tuple((n, counts[item]) for n, item in enumerate(items) if counts[item])
+        key = (owned, wanted, held)
+        if key in bounds:
+            return bounds[key]
+
+        bound = float('inf')
+        for made, goal_value, values in tool_potentials(owned):
+            if wanted <= made:
+                bound = min(bound, goal_value - sum(values[n] * num for n, num in held))
+                if limit is not None and bound <= limit:
+                    return max(bound, 0)
+        if len(bounds) >= 100000:
+            bounds.clear()
+        bounds[key] = max(bound, 0)
+        return bounds[key]
+
+    def time_bound(state, tasks):
+        counts = amounts(state)
+        return max(task_bound(counts, tasks), potential_bound(counts, tasks))
+
+    # The parts, for TimeCheck
+    time_bound.amounts = amounts
+    time_bound.task_bound = task_bound
+    time_bound.potential_bound = potential_bound
+
+    return time_bound
+
+
+# A copy of data cut down to the recipes that can help make data['Goal'] and the items and tools they use. Given the
+# time budget, tools that can't be made in time and their recipes are dropped too. Every item that is left keeps all
+# of its recipes that could succeed, so a domain and state set up from it find the same plan, with fewer operators
+# and methods, smaller states and fewer tool sets for make_time_bound to consider
+def relevant_data(data, time=None, graph=None):
+    graph = graph or RecipeGraph(data)
+    recipes, items = graph.relevant(data['Goal'], data['Initial'], time)
+    return dict(data,
+                Items=[item for item in data['Items'] if item in items],
+                Tools=[tool for tool in data['Tools'] if tool in items],
+                Recipes={name: rule for name, rule in data['Recipes'].items() if name in recipes},
+                Initial={item: num for item, num in data['Initial'].items() if item in items})
+
+
+# A pyhop check that prunes every node whose tasks need more time, by make_time_bound, than the agent has left. No
+# plan is lost, since operators fail without the time anyway, but infeasible budgets fail at the first node instead
+# of after the whole tree. After a search that found no plan, reason() says why from the cut nearest the root
+class TimeCheck(object):
+    def __init__(self, data, ID, graph=None):
+        self.__name__ = 'time_check'
+        self.ID = ID
+        self.time_bound = make_time_bound(data, ID, graph)
+        self.reset()
+
+    def reset(self):
+        self.pruned = 0
+        self.nearest = None
+
+    def __call__(self, state, curr_task, tasks, plan, depth, calling_stack):
+        left = state.time[self.ID]
+        counts = self.time_bound.amounts(state)
+        needed = self.time_bound.task_bound(counts, tasks)
+        if needed <= left:
+            needed = self.time_bound.potential_bound(counts, tasks, left)
+            if needed <= left:
+                return False
 
-def set_up_state(data, ID, time=0):
-    state = pyhop.State('state')
+        self.pruned += 1
+        if self.nearest is None or depth < self.nearest[0]:
+            self.nearest = (depth, curr_task, tasks, needed, left)
+        return True
+
+    def reason(self):
+        if self.nearest is None:
+            return None
+        depth, task, tasks, needed, left = self.nearest
+        if depth == 0:
+            return 'the goal needs at least {} time but only {} is available'.format(needed, left)
+        return '{} branches ran out of time; the one nearest the root, at {} (depth {}), needed at least {} time ' \
+               'for its {} tasks with {} left'.format(self.pruned, task, depth, needed, len(tasks), left)
+
+
+def add_time_check(data, ID, graph=None, domain=None):
+    check = TimeCheck(data, ID, graph)
+    (domain or pyhop.default_domain).add_check(check)
+    return check
+
+
+class TimeNogoods(pyhop.Nogoods):
+    """
+    Dead ends for the domain from make_domain, remembered along with the
+    time ID had left: a search that failed with some time fails with any
+    less, since only operators look at time, and the TimeCheck only prunes
+    more with less. The rest of the key is what the search below a node
+    depends on: the inventory, the tasks, and the parts of the calling
+    stack the heuristic looks at (the tools being produced, and the task on
+    top with how often it repeats).
+    """
+
+    def __init__(self, data, ID, maxsize=100000):
+        pyhop.Nogoods.__init__(self, maxsize)
+        self.ID = ID
+        self.tools = set(data['Tools'])
+
+    def key(self, state, tasks, calling_stack):
+        left = state.time[self.ID]
+        if isinstance(state, CompactState):
+            clock = state.rows[self.ID] + state.index['time']
+            inventory = state.values[:clock].tobytes() + state.values[clock + 1:].tobytes()
+        else:
+            times = tuple(sorted((other, time) for other, time in state.time.items() if other != self.ID))
+            inventory = tuple((name, value) for name, value in pyhop.state_key(state) if name != 'time') + (times,)
+        tools = frozenset(task for task in calling_stack if task[0] == 'produce' and task[2] in self.tools)
+        top = None
+        if len(calling_stack):
+            top = (calling_stack[-1], min(calling_stack.run, MAX_REPETITIONS),
+                   min(len(calling_stack), MAX_REPETITIONS + 1))
+        return (inventory, tuple(tasks), tools, top), left
+
+
+# Everything needed to plan for data['Goal'] in one pyhop.Domain, which can be kept and reused. compact=True declares
+# the operators and methods for the state from set_up_compact_state, compiled=True the ones from codegen, and
+# lifted=True the lifted ones, whose plans have (op, ID, count) steps (see expand_plan). time_check=True adds a
+# TimeCheck after the heuristic, and nogoods=True gives the domain TimeNogoods, so that its searches skip the dead ends
+# of earlier ones
+def make_domain(data, ID, compact=False, graph=None, compiled=False, lifted=False, time_check=False, nogoods=False):
+    domain = pyhop.Domain('crafting')
+    graph = graph or RecipeGraph(data)
+    declare_operators(data, item_index(data) if compact else None, domain, compiled, lifted)
+    declare_methods(data, compact, graph, domain, compiled, lifted)
+    add_heuristic(data, ID, domain)
+    if time_check:
+        add_time_check(data, ID, graph, domain)
+    if nogoods:
+        domain.nogoods = TimeNogoods(data, ID)
+    return domain
+
+
+# undo=True gives a pyhop.UndoState, which pyhop rolls back on backtracking instead of deep-copying at every operator
+def set_up_state(data, ID, time=0, undo=False):
+    state = pyhop.UndoState('state') if undo else pyhop.State('state')
     state.time = {ID: time}
 
     for item in data['Items']:
@@ -232,6 +549,18 @@ def set_up_state(data, ID, time=0):
     return state
 
 
+# One row per agent in IDs, all starting from data['Initial'] with the same time budget
+def set_up_compact_state(data, IDs, time=0, index=None):
+    state = CompactState('state', index or item_index(data), IDs)
+
+    for ID in IDs:
+        state.time = {ID: time}
+        for item, num in data['Initial'].items():
+            setattr(state, item, {ID: num})
+
+    return state
+
+
 def set_up_goals(data, ID):
     goals = []
     for item, num in data['Goal'].items():
@@ -0,0 +1,89 @@
+"""
+Solve many crafting problems in one call.
+
+A problem is a dict with the same 'Initial' and 'Goal' keys as
+crafting.json plus a 'time' budget (and optionally an agent 'ID'). The
+Recipes, Items and Tools are shared: every worker process loads the
+compiled domain for them once (from domain_cache), and each problem only sets up its own state, goals
+and heuristic.
+
+    for index, plan in plan_batch(problems, workers=4):
+        ...
+
+Results are yielded as soon as they finish, so they arrive out of order;
+index is the position of the problem in problems.
+"""
+
+import concurrent.futures
+import json
+
+import autoHTN
+import domain_cache
+import pyhop
+
+# The domain compiled by _load_domain in this process: (rules, item index, pyhop.Domain without checks)
+_domain = None
+
+
+def _load_domain(rules):
+    global _domain
+    cached = domain_cache.load(rules)
+    domain = pyhop.Domain('crafting')
+    autoHTN.declare_operators(rules, cached.index, domain)
+    autoHTN.declare_methods(rules, compact=True, graph=cached.graph, domain=domain)
+    _domain = (rules, cached.index, domain)
+
+
+def solve(problem):
+    """Plan one problem against the domain loaded in this process. Returns the plan or False."""
+    domain, state, goals = set_up(problem)
+    return domain.pyhop(state, goals)
+
+
+def set_up(problem):
+    """The (domain, state, goals) to search for one problem, against the domain loaded in this process."""
+    rules, index, shared = _domain
+    data = dict(rules, Initial=problem.get('Initial', {}), Goal=problem['Goal'])
+    ID = problem.get('ID', 'agent')
+
+    # The heuristic closes over this problem's goal, so each problem gets a domain that shares the compiled operators
+    # and methods but holds only its own checks
+    domain = pyhop.Domain(shared.__name__, shared.operators, shared.methods)
+    autoHTN.add_heuristic(data, ID, domain)
+
+    state = autoHTN.set_up_compact_state(data, [ID], time=problem.get('time', 0), index=index)
+    return domain, state, autoHTN.set_up_goals(data, ID)
+
+
+def _solve(index_problem):
+    index, problem = index_problem
+    return index, solve(problem)
+
+
+def plan_batch(problems, workers=None, rules=None):
+    """
+    Generate (index, plan) for every problem as it is solved, in a pool of
+    workers processes. rules is the parsed crafting.json (read from the
+    current directory if not given). With workers=None the problems are
+    solved one by one in this process. Nothing is declared in pyhop's
+    default domain either way.
+    """
+    if rules is None:
+        with open('crafting.json') as f:
+            rules = json.load(f)
+    rules = {key: rules[key] for key in ('Items', 'Tools', 'Recipes')}
+
+    if workers is None:
+        _load_domain(rules)
+        for index, problem in enumerate(problems):
+            yield index, solve(problem)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=_load_domain, initargs=(rules,)) as pool:
+        futures = [pool.submit(_solve, (index, problem)) for index, problem in enumerate(problems)]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
@@ -0,0 +1,309 @@
+import argparse
+import copy
+import itertools
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+import autoHTN
+import codegen
+import pyhop
+import simulator
+
+# Goals to time the planner on, roughly from cheapest to most expensive
+GOALS = [
+    {'wooden_pickaxe': 1},
+    {'furnace': 1},
+    {'iron_pickaxe': 1},
+    {'cart': 1, 'rail': 20},
+]
+
+
+# The graded suite: each goal is scaled by every size in SUITE_SIZES (tools stay at 1), from a random starting
+# inventory and time budget. Anything still unsolved after SUITE_MAX_NODES nodes counts as BUDGET_EXHAUSTED
+SUITE_GOALS = [
+    {'wood': 5},
+    {'plank': 8},
+    {'wooden_pickaxe': 1},
+    {'stone_pickaxe': 1},
+    {'furnace': 1},
+    {'iron_pickaxe': 1},
+    {'rail': 10},
+    {'cart': 1, 'rail': 10},
+]
+SUITE_SIZES = (1, 2, 4, 8)
+SUITE_MAX_NODES = 20000
+
+# How much worse than the baseline a measurement may get before it counts as a regression, as (fraction, amount):
+# timings under a millisecond are mostly noise. Nodes, plan cost and status come out the same on every run, so they
+# get no slack
+TOLERANCES = {'seconds': (0.5, 0.001), 'peak_bytes': (0.1, 4096), 'nodes': (0, 0), 'cost': (0, 0)}
+
+
+def load_domain(data, ID, index=None, compiled=False):
+    # The heuristic closes over data['Goal'], so the checks have to be rebuilt for every goal
+    del pyhop.checks[:]
+    autoHTN.declare_operators(data, index, compiled=compiled)
+    autoHTN.declare_methods(data, compact=index is not None, compiled=compiled)
+    autoHTN.add_heuristic(data, ID)
+
+
+def traced_blocks():
+    # Number of memory blocks tracemalloc currently traces, not counting its own bookkeeping
+    snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    return sum(stat.count for stat in snapshot.statistics('filename'))
+
+
+def measure(plan_once, repeat=20):
+    # Returns (seconds per plan, peak bytes allocated while planning, net blocks still allocated after planning, plan)
+    plan = plan_once()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        plan_once()
+    elapsed = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    blocks_before = traced_blocks()
+    result = plan_once()
+    peak = tracemalloc.get_traced_memory()[1]
+    blocks = traced_blocks() - blocks_before
+    del result
+    tracemalloc.stop()
+
+    return elapsed, peak - before, blocks, plan
+
+
+def set_up(data, ID, mode, time_budget, compiled=False):
+    # Declares the operators that match the state representation and returns a fresh initial state
+    if mode == 'compact':
+        index = autoHTN.item_index(data)
+        load_domain(data, ID, index, compiled)
+        return autoHTN.set_up_compact_state(data, [ID], time=time_budget, index=index)
+
+    load_domain(data, ID, compiled=compiled)
+    return autoHTN.set_up_state(data, ID, time=time_budget, undo=(mode == 'undo'))
+
+
+def compare_states(data, ID='agent', time_budget=300, repeat=20, modes=('deepcopy', 'undo', 'compact')):
+    # Deep-copied State against the journaled UndoState and the array-backed CompactState on the same goals
+    rows = []
+    for goal in GOALS:
+        data = copy.deepcopy(data)
+        data['Goal'] = goal
+        goals = autoHTN.set_up_goals(data, ID)
+
+        row = {'goal': goal}
+        for mode in modes:
+            state = set_up(data, ID, mode, time_budget)
+            elapsed, peak, blocks, plan = measure(lambda: pyhop.pyhop(state, goals), repeat)
+            row[mode] = {'seconds': elapsed, 'peak_bytes': peak, 'blocks': blocks, 'plan_length': len(plan) if plan else None}
+        rows.append(row)
+
+    return rows
+
+
+def compare_compiled(data, ID='agent', mode='compact', time_budget=300, repeat=20):
+    # The closures from make_operator/make_method against the generated code from codegen, on the same goals
+    rows = []
+    for goal in GOALS:
+        data = copy.deepcopy(data)
+        data['Goal'] = goal
+        goals = autoHTN.set_up_goals(data, ID)
+
+        row = {'goal': goal}
+        for name, compiled in (('closure', False), ('compiled', True)):
+            state = set_up(data, ID, mode, time_budget, compiled)
+            elapsed, peak, blocks, plan = measure(lambda: pyhop.pyhop(state, goals), repeat)
+            row[name] = {'seconds': elapsed, 'peak_bytes': peak, 'blocks': blocks, 'plan_length': len(plan) if plan else None}
+        if row['closure']['plan_length'] != row['compiled']['plan_length']:
+            raise AssertionError('compiled domain found a different plan for {}'.format(goal))
+        rows.append(row)
+
+    return rows
+
+
+def time_operators(data, mode='compact', repeat=2000):
+    # Seconds per call of every recipe's operator on a well-stocked state, closure then compiled
+    index = autoHTN.item_index(data) if mode == 'compact' else None
+    rich = dict(data, Initial={item: 50 for item in itertools.chain(data['Items'], data['Tools'])})
+    if index is None:
+        state = autoHTN.set_up_state(rich, 'agent', time=10 ** 6)
+    else:
+        state = autoHTN.set_up_compact_state(rich, ['agent'], time=10 ** 6, index=index)
+
+    timings = {}
+    for name, rule in data['Recipes'].items():
+        closure = autoHTN.make_operator(rule) if index is None else autoHTN.make_compact_operator(rule, index)
+        compiled = codegen.compile_operator(name, rule, index)
+        row = []
+        for operator in (closure, compiled):
+            # Work on a copy so every call succeeds, and time only the calls
+            copied = copy.deepcopy(state)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                operator(copied, 'agent')
+            row.append((time.perf_counter() - start) / repeat)
+        timings[name] = tuple(row)
+
+    return timings
+
+
+def generate_problems(data, seed=0, sizes=SUITE_SIZES, goals=SUITE_GOALS):
+    # The same list of problems for the same seed, in the format batch.plan_batch takes plus a 'name'
+    rng = random.Random(seed)
+    problems = []
+    for size in sizes:
+        for goal in goals:
+            goal = {item: num if item in data['Tools'] else num * size for item, num in goal.items()}
+            initial = {}
+            for item in ('wood', 'plank', 'stick', 'cobble'):
+                if rng.random() < 0.5:
+                    initial[item] = rng.randint(1, 3 * size)
+            for tool in ('bench', 'wooden_pickaxe', 'furnace'):
+                if rng.random() < 0.25:
+                    initial[tool] = 1
+            name = '{} x{}'.format(', '.join('{} {}'.format(num, item) for item, num in sorted(goal.items())), size)
+            problems.append({'name': name, 'Initial': initial, 'Goal': goal, 'time': rng.choice((1, 2)) * 300 * size})
+
+    return problems
+
+
+def run_suite(data, problems, ID='agent', repeat=5, max_nodes=SUITE_MAX_NODES, compact=True, compiled=False,
+              relevant=False, lifted=False, time_check=False):
+    # One result per problem: the fastest of repeat runs, nodes, peak bytes of one traced run, the plan's Time, and
+    # whether simulator.Simulator accepts the plan (None without one). relevant=True plans each problem in autoHTN.relevant_data, lifted=True with the lifted methods, and
+    # time_check=True with an autoHTN.TimeCheck
+    results = []
+    for problem in problems:
+        problem_data = dict(data, Initial=problem['Initial'], Goal=problem['Goal'])
+        if relevant:
+            problem_data = autoHTN.relevant_data(problem_data, problem['time'])
+        domain = autoHTN.make_domain(problem_data, ID, compact, compiled=compiled, lifted=lifted,
+                                     time_check=time_check)
+        goals = autoHTN.set_up_goals(problem_data, ID)
+        if compact:
+            state = autoHTN.set_up_compact_state(problem_data, [ID], time=problem['time'])
+        else:
+            state = autoHTN.set_up_state(problem_data, ID, time=problem['time'], undo=True)
+
+        def plan_once():
+            return domain.anytime(state, goals).run(max_nodes=max_nodes)
+
+        seconds = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = plan_once()
+            seconds = min(seconds, time.perf_counter() - start)
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        plan_once()
+        peak = tracemalloc.get_traced_memory()[1] - before
+        tracemalloc.stop()
+
+        action_time = autoHTN.make_action_time(problem_data)
+        plan = result['plan']
+        valid = simulator.Simulator(dict(data, Initial=problem['Initial'], Goal=problem['Goal']), [ID]).replay(
+            plan, problem['time'])['valid'] if plan is not False else None
+        results.append({'name': problem['name'], 'status': result['status'], 'seconds': seconds,
+                        'nodes': result['nodes'], 'peak_bytes': peak,
+                        'cost': sum(map(action_time, plan)) if plan is not False else None,
+                        'plan_length': len(autoHTN.expand_plan(plan)) if plan is not False else None, 'valid': valid})
+
+    return results
+
+
+def find_regressions(results, baseline, tolerances=TOLERANCES):
+    # Messages for every result that is worse than the same-named baseline result by more than its tolerance
+    baseline = {row['name']: row for row in baseline}
+    regressions = []
+    for row in results:
+        old = baseline.get(row['name'])
+        if old is None:
+            continue
+        if row.get('valid') is False:
+            regressions.append('{}: the plan is not valid'.format(row['name']))
+        if row['status'] != old['status']:
+            regressions.append('{}: status {} -> {}'.format(row['name'], old['status'], row['status']))
+            continue
+        for metric, (fraction, amount) in tolerances.items():
+            if row[metric] is None or old[metric] is None:
+                continue
+            if row[metric] > old[metric] * (1 + fraction) + amount:
+                regressions.append('{}: {} {} -> {}'.format(row['name'], metric, old[metric], row[metric]))
+
+    return regressions
+
+
+def print_suite(results):
+    print('{:<32}{:>18}{:>12}{:>12}{:>12}{:>8}'.format('problem', 'status', 'ms', 'nodes', 'KiB', 'cost'))
+    for row in results:
+        print('{:<32}{:>18}{:>12.3f}{:>12}{:>12.1f}{:>8}'.format(row['name'], row['status'], row['seconds'] * 1000,
+                                                                row['nodes'], row['peak_bytes'] / 1024.0,
+                                                                row['cost'] if row['cost'] is not None else '-'))
+
+
+def print_comparison(rows, modes):
+    print('{:<32}'.format('goal') + ''.join('{:>16}{:>16}{:>16}'.format(m + ' ms', m + ' KiB', m + ' blocks')
+                                            for m in modes))
+    for row in rows:
+        line = '{:<32}'.format(', '.join('{} {}'.format(n, item) for item, n in row['goal'].items()))
+        for mode in modes:
+            line += '{:>16.3f}{:>16.1f}{:>16}'.format(row[mode]['seconds'] * 1000, row[mode]['peak_bytes'] / 1024,
+                                                     row[mode]['blocks'])
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the crafting planner.')
+    parser.add_argument('--suite', action='store_true',
+                        help='run the generated problem suite instead of comparing state and operator representations')
+    parser.add_argument('--baseline', default='benchmark_baseline.json',
+                        help='suite results to compare against (default: %(default)s)')
+    parser.add_argument('--save', action='store_true', help='store the suite results as the new baseline')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with open('crafting.json') as f:
+        data = json.load(f)
+
+    if not args.suite:
+        compare(data)
+        return 0
+
+    results = run_suite(data, generate_problems(data, args.seed))
+    print_suite(results)
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1)
+        return 0
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except IOError:
+        print('no baseline at {}; run with --save to store one'.format(args.baseline))
+        return 0
+    regressions = find_regressions(results, baseline)
+    for message in regressions:
+        print('REGRESSION ' + message)
+    return 1 if regressions else 0
+
+
+def compare(data):
+    print_comparison(compare_states(data), ('deepcopy', 'undo', 'compact'))
+    print()
+    print_comparison(compare_compiled(data), ('closure', 'compiled'))
+    print()
+    for mode in ('deepcopy', 'compact'):
+        timings = time_operators(data, mode).values()
+        print('{} operators: closure {:.3f} us/call, compiled {:.3f} us/call'.format(
+            mode, sum(t[0] for t in timings) / len(timings) * 1e6, sum(t[1] for t in timings) / len(timings) * 1e6))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
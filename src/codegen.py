@@ -0,0 +1,157 @@
+"""
+Compile crafting recipes into specialized Python functions.
+
+make_operator and make_method in autoHTN build one generic closure per
+recipe that walks the rule dicts on every call. The functions here write
+out the source of a straight-line function for each recipe instead, with
+every check unrolled and every item name, slot and amount inlined as a
+constant, and exec it once:
+
+    def op_craft_plank(state, ID):
+        wood = state.wood
+        if wood[ID] < 1: return False
+        time = state.time
+        if time[ID] < 1: return False
+        wood[ID] -= 1
+        ...
+
+The compiled functions behave exactly like the closures they replace and
+carry the same produces/time tags. Their source is kept in .source and in
+linecache, so tracebacks and pdb show the generated code. Each source is
+only compiled once per process (see code_cache).
+"""
+
+import itertools
+import linecache
+
+from recipes import op_name
+
+
+# Code objects already compiled in this process, by source; domain_cache saves and restores them
+code_cache = {}
+
+
+def _exec(name, lines, namespace=None):
+    # Runs the source for one function and returns the function, registered with linecache under a made-up filename
+    source = '\n'.join(lines) + '\n'
+    filename = '<codegen {}>'.format(name)
+    namespace = dict(namespace or {})
+    code = code_cache.get(source)
+    if code is None:
+        code = code_cache[source] = compile(source, filename, 'exec')
+    exec(code, namespace)
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+
+    function = namespace[name]
+    function.source = source
+    return function
+
+
+def _local(item):
+    # A local variable name for the state variable item, which need not be a valid identifier
+    return '_' + ''.join(c if c.isalnum() else '_' for c in item)
+
+
+def _attribute(item):
+    return 'state.' + item if item.isidentifier() else 'getattr(state, {!r})'.format(item)
+
+
+def operator_source(name, rule):
+    """Source of the compiled operator for rule, for a pyhop.State or UndoState. Same semantics as make_operator."""
+    lines = ['def {}(state, ID):'.format(name)]
+    bound = set()
+
+    def bind(item):
+        if item not in bound:
+            bound.add(item)
+            lines.append('    {} = {}'.format(_local(item), _attribute(item)))
+
+    # Same checks in the same order as make_operator: Requires, Consumes, then time
+    for item, num in itertools.chain(rule.get('Requires', {}).items(), rule.get('Consumes', {}).items(),
+                                     [('time', rule['Time'])]):
+        bind(item)
+        lines.append('    if {}[ID] < {!r}: return False'.format(_local(item), num))
+
+    for item, num in rule.get('Consumes', {}).items():
+        lines.append('    {}[ID] -= {!r}'.format(_local(item), num))
+    for item, num in rule['Produces'].items():
+        bind(item)
+        lines.append('    {}[ID] += {!r}'.format(_local(item), num))
+    lines.append('    {}[ID] -= {!r}'.format(_local('time'), rule['Time']))
+    lines.append('    return state')
+
+    return lines
+
+
+def compact_operator_source(name, rule, index):
+    """Source of the compiled operator for rule, for a CompactState built with index. Same semantics as make_compact_operator."""
+    # Fold Requires and Consumes into one minimum per slot, and Consumes/Produces/Time into one delta per slot
+    minimums = {index['time']: rule['Time']}
+    for item, num in itertools.chain(rule.get('Requires', {}).items(), rule.get('Consumes', {}).items()):
+        minimums[index[item]] = max(minimums.get(index[item], 0), num)
+
+    deltas = {index['time']: -rule['Time']}
+    for item, num in rule.get('Consumes', {}).items():
+        deltas[index[item]] = deltas.get(index[item], 0) - num
+    for item, num in rule['Produces'].items():
+        deltas[index[item]] = deltas.get(index[item], 0) + num
+
+    lines = ['def {}(state, ID):'.format(name),
+             '    values = state.values',
+             '    row = state.rows[ID]']
+    for slot, num in minimums.items():
+        lines.append('    if values[row + {}] < {!r}: return False'.format(slot, num))
+    for slot, num in deltas.items():
+        if num:
+            lines.append('    values[row + {}] {} {!r}'.format(slot, '+=' if num > 0 else '-=', abs(num)))
+    lines.append('    return state')
+
+    return lines
+
+
+def compile_operator(recipe_name, rule, index=None):
+    """
+    The operator op_name(recipe_name) for rule, compiled. Pass the index
+    from item_index(data) for one that only works on a CompactState.
+    """
+    name = op_name(recipe_name)
+    if index is None:
+        operator = _exec(name, operator_source(name, rule))
+    else:
+        operator = _exec(name, compact_operator_source(name, rule, index))
+
+    operator.produces = next(iter(rule['Produces']))
+    operator.time = rule['Time']
+
+    return operator
+
+
+def compile_method(recipe_name, rule, consume_order=None):
+    """
+    The method for rule, compiled; the same subtasks as autoHTN.make_method.
+    The task tuples are built once per agent ID and reused, and every call
+    gets its own list of them.
+    """
+    name = str(recipe_name).replace(" ", "_")
+    consumes = rule.get('Consumes', {})
+    if consume_order is not None:
+        consumes = [(item, consumes[item]) for item in consume_order if item in consumes]
+    else:
+        consumes = list(consumes.items())
+
+    tasks = ["('have_enough', ID, {!r}, {!r})".format(item, num)
+             for item, num in itertools.chain(rule.get('Requires', {}).items(), consumes)]
+    tasks.append('({!r}, ID)'.format(op_name(recipe_name)))
+
+    lines = ['def {}(state, ID):'.format(name),
+             '    try:',
+             '        return list(_prebuilt[ID])',
+             '    except KeyError:',
+             '        tasks = _prebuilt[ID] = ({},)'.format(', '.join(tasks)),
+             '        return list(tasks)']
+    method = _exec(name, lines, {'_prebuilt': {}})
+
+    method.produces = next(iter(rule['Produces']))
+    method.time = rule['Time']
+
+    return method
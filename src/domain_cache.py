@@ -0,0 +1,121 @@
+"""
+Cache the compiled parts of a crafting domain on disk.
+
+Building a domain from crafting.json spends most of its time tabulating the
+RecipeGraph (unit values for every set of tools) and compiling the
+functions codegen writes. load() keeps both in one pickle per recipe set,
+named by a hash of the Items, Tools and Recipes of the JSON, so a new
+process (a worker, a CLI run) reads them back in a millisecond or two:
+
+    cached = domain_cache.load(data)
+    domain = autoHTN.make_domain(data, 'agent', compact=True, graph=cached.graph, compiled=True)
+
+Changing the recipes changes the hash, so an outdated artifact is never
+read; it is simply rebuilt under the new name. The Initial and Goal of the
+JSON are not part of the key, since nothing cached depends on them.
+"""
+
+import hashlib
+import json
+import marshal
+import os
+import pickle
+import sys
+import tempfile
+
+import autoHTN
+import codegen
+import pyhop
+from inventory import item_index
+from recipes import RecipeGraph
+
+# Bump when what is cached, or how it is built, changes; older artifacts are then ignored
+VERSION = 1
+
+DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '__domaincache__')
+
+
+class CompiledDomain(object):
+    """
+    What load() returns: key, the hash naming the artifact; index, the
+    item_index of the data; graph, its RecipeGraph; and code, the codegen
+    code objects for every compiled operator and method, by source.
+    """
+
+    def __init__(self, key, index, graph, code):
+        self.key = key
+        self.index = index
+        self.graph = graph
+        self.code = code
+
+    def __reduce__(self):
+        # Code objects don't pickle, but marshal writes them for this Python version
+        code = {source: marshal.dumps(c) for source, c in self.code.items()}
+        return (_restore, (self.key, self.index, self.graph, code))
+
+
+def _restore(key, index, graph, code):
+    return CompiledDomain(key, index, graph, {source: marshal.loads(c) for source, c in code.items()})
+
+
+def domain_key(data):
+    """The hash of the parts of data that the compiled domain depends on, and of this cache's format."""
+    recipes = {name: data[name] for name in ('Items', 'Tools', 'Recipes')}
+    text = json.dumps([VERSION, sys.implementation.cache_tag, recipes], sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def build(data):
+    """Compile the domain of data from scratch, without touching the disk."""
+    index = item_index(data)
+    graph = RecipeGraph(data)
+    # Compile against an empty code_cache, so that everything these recipes need ends up in it
+    saved = dict(codegen.code_cache)
+    codegen.code_cache.clear()
+    try:
+        for compact_index in (None, index):
+            domain = pyhop.Domain('crafting')
+            autoHTN.declare_operators(data, compact_index, domain, compiled=True)
+            autoHTN.declare_methods(data, compact_index is not None, graph, domain, compiled=True)
+        code = dict(codegen.code_cache)
+    finally:
+        codegen.code_cache.update(saved)
+    return CompiledDomain(domain_key(data), index, graph, code)
+
+
+def load(data, directory=None):
+    """
+    The CompiledDomain of data, read from the cache in directory (DIRECTORY
+    by default) or built and saved there if it has none for these recipes
+    or can't read it. Its compiled code is added to codegen.code_cache, so
+    make_domain(..., compiled=True) doesn't compile anything.
+    """
+    directory = directory or DIRECTORY
+    key = domain_key(data)
+    path = os.path.join(directory, key + '.pickle')
+
+    compiled = None
+    try:
+        with open(path, 'rb') as f:
+            compiled = pickle.load(f)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        pass
+    if not isinstance(compiled, CompiledDomain) or compiled.key != key:
+        compiled = build(data)
+        _save(compiled, directory, path)
+
+    codegen.code_cache.update(compiled.code)
+    return compiled
+
+
+def _save(compiled, directory, path):
+    # Write to a temporary file and rename it, so other processes never read a half-written artifact
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(compiled, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+    except OSError:
+        # A read-only checkout still works, it just builds the domain every time
+        pass
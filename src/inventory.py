@@ -0,0 +1,168 @@
+"""
+A compact, array-backed alternative to pyhop.State for the crafting domain.
+
+Every state variable (time, then each item and tool) is interned to a slot,
+and every agent ID to a row. All values live in one flat array('i'), so
+copying, hashing and comparing a state is a single memcpy/memcmp of that
+buffer. getattr(state, item)[ID] still works, so methods and operators
+written for pyhop.State keep running on it unchanged.
+
+AgentColumns holds the same variables for many agents the other way round,
+one array per variable across agents, for multiagent.plan_agents.
+"""
+
+from array import array
+
+
+def item_index(data):
+    # Slot 0 is always time; the rest follow the order in crafting.json
+    names = ['time'] + list(data['Items']) + [tool for tool in data['Tools'] if tool not in data['Items']]
+    return {name: slot for slot, name in enumerate(names)}
+
+
+class _Column(object):
+    """One state variable across all agents, indexable by agent ID like the {ID: n} dicts of pyhop.State."""
+    __slots__ = ('state', 'slot')
+
+    def __init__(self, state, slot):
+        self.state = state
+        self.slot = slot
+
+    def __getitem__(self, ID):
+        state = self.state
+        return state.values[state.rows[ID] + self.slot]
+
+    def __setitem__(self, ID, value):
+        state = self.state
+        state.values[state.rows[ID] + self.slot] = value
+
+    def __contains__(self, ID):
+        return ID in self.state.rows
+
+    def keys(self):
+        return self.state.rows.keys()
+
+    def items(self):
+        return [(ID, self[ID]) for ID in self.state.rows]
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class CompactState(object):
+    """
+    State with one row of ints per agent. index maps variable names to slots
+    and agents lists the agent IDs; both are shared, never copied.
+    """
+    __slots__ = ('__name__', 'index', 'rows', 'width', 'values')
+
+    def __init__(self, name, index, agents, values=None):
+        object.__setattr__(self, '__name__', name)
+        object.__setattr__(self, 'index', index)
+        object.__setattr__(self, 'rows', agents if isinstance(agents, dict) else
+                           {ID: row * len(index) for row, ID in enumerate(agents)})
+        object.__setattr__(self, 'width', len(index))
+        if values is None:
+            values = array('i', bytes(4 * len(index) * len(self.rows)))
+        object.__setattr__(self, 'values', values)
+
+    def __getattr__(self, name):
+        try:
+            return _Column(self, self.index[name])
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        # Accepts the same {ID: n} dicts that set_up_state assigns to a pyhop.State
+        if name not in self.index:
+            raise AttributeError('{} is not a variable of this state'.format(name))
+        slot = self.index[name]
+        for ID, num in value.items():
+            self.values[self.rows[ID] + slot] = num
+
+    def __reduce__(self):
+        # The default pickling would restore the slots through __setattr__, which needs index to already be set
+        return (CompactState, (self.__name__, self.index, self.rows, self.values))
+
+    def __deepcopy__(self, memo):
+        return CompactState(self.__name__, self.index, self.rows, self.values[:])
+
+    def __eq__(self, other):
+        return isinstance(other, CompactState) and self.index == other.index and self.values == other.values
+
+    def __ne__(self, other):
+        return not self == other
+
+    def key(self):
+        # Canonical key for pyhop.state_key: the raw bytes of the array
+        return self.values.tobytes()
+
+    def __hash__(self):
+        # States are mutable, so only hash one that will no longer change
+        return hash(self.values.tobytes())
+
+    def as_dict(self):
+        return {name: _Column(self, slot) for name, slot in self.index.items()}
+
+
+class _AgentColumn(object):
+    """One variable of an AgentColumns, indexable by agent ID."""
+    __slots__ = ('state', 'column')
+
+    def __init__(self, state, column):
+        self.state = state
+        self.column = column
+
+    def __getitem__(self, ID):
+        return self.column[self.state.positions[ID]]
+
+    def __setitem__(self, ID, value):
+        self.column[self.state.positions[ID]] = value
+
+    def __repr__(self):
+        return repr({ID: self.column[position] for ID, position in self.state.positions.items()})
+
+
+class AgentColumns(object):
+    """
+    The inventories of many agents, stored column by column: columns[slot]
+    is an array('i') with that variable for every agent, the agent ID at
+    positions[ID]. getattr(state, item)[ID] and state.item = {ID: n} work
+    as on a CompactState; row(ID) and assign(IDs, row) read and write whole
+    agents, so agents holding the same can be found and updated together.
+    """
+    __slots__ = ('index', 'agents', 'positions', 'columns')
+
+    def __init__(self, index, agents):
+        object.__setattr__(self, 'index', index)
+        object.__setattr__(self, 'agents', list(agents))
+        object.__setattr__(self, 'positions', {ID: position for position, ID in enumerate(self.agents)})
+        object.__setattr__(self, 'columns', [array('i', bytes(4 * len(self.agents))) for _ in index])
+
+    def __getattr__(self, name):
+        try:
+            return _AgentColumn(self, self.columns[self.index[name]])
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name not in self.index:
+            raise AttributeError('{} is not a variable of this state'.format(name))
+        column = self.columns[self.index[name]]
+        for ID, num in value.items():
+            column[self.positions[ID]] = num
+
+    def row(self, ID):
+        """Every variable of agent ID, in slot order, as a tuple."""
+        position = self.positions[ID]
+        return tuple(column[position] for column in self.columns)
+
+    def assign(self, IDs, row):
+        """Set every variable of each agent in IDs from row, as returned by row()."""
+        positions = [self.positions[ID] for ID in IDs]
+        for column, value in zip(self.columns, row):
+            for position in positions:
+                column[position] = value
+
+    def inventory(self, ID):
+        return dict(zip(self.index, self.row(ID)))
@@ -0,0 +1,75 @@
+"""
+Plan for many agents over one shared AgentColumns state.
+
+Agents in the crafting domain never interact: what an agent can do depends
+only on its own inventory, time and goal. plan_agents groups the agents
+that match on all three, searches once per group, and gives every agent in
+the group that plan under its own ID; the whole group then moves to the
+plan's end state in one assignment. One domain is built per distinct goal
+and shared by every group with that goal. So N agents that fall into k
+groups cost k searches, not N:
+
+    state = set_up_agents(data, ['a1', 'a2', 'a3'], time=300)
+    plans = plan_agents(data, state, {'a3': {'rail': 4}})
+"""
+
+from array import array
+
+import autoHTN
+import domain_cache
+from inventory import AgentColumns, CompactState, item_index
+
+# The agent ID each group is planned under, before its plan is copied out to the group's own IDs
+_ID = 'agent'
+
+
+def set_up_agents(data, agents, time=0, index=None):
+    """An AgentColumns for agents, each starting from data['Initial'] with time."""
+    state = AgentColumns(index or item_index(data), agents)
+    state.time = {ID: time for ID in agents}
+    for item, num in data['Initial'].items():
+        setattr(state, item, {ID: num for ID in agents})
+    return state
+
+
+def group_agents(state, goals, default_goal):
+    """{(row, goal items): [IDs]} for the agents of state, in order; see plan_agents for goals."""
+    groups = {}
+    for ID in state.agents:
+        goal = goals.get(ID, default_goal)
+        groups.setdefault((state.row(ID), tuple(goal.items())), []).append(ID)
+    return groups
+
+
+def plan_agents(data, state, goals=None, stats=None, **options):
+    """
+    Plan for every agent in state (an AgentColumns) to reach goals[ID], an
+    {item: num} dict like data['Goal'], which is used for agents not in
+    goals. options are passed on to autoHTN.make_domain (lifted, compiled,
+    time_check, ...), and stats, a pyhop.SearchStats, to every search.
+    Returns {ID: plan, or False}, each plan the one make_domain(...).pyhop
+    finds for that agent alone, and moves every agent that has a plan to
+    the state at its end.
+    """
+    graph = domain_cache.load(data).graph
+    domains = {}
+    plans = {}
+    for (row, goal), IDs in group_agents(state, goals or {}, data['Goal']).items():
+        if goal not in domains:
+            goal_data = dict(data, Goal=dict(goal))
+            domain = autoHTN.make_domain(goal_data, _ID, compact=True, graph=graph, **options)
+            domains[goal] = (domain, autoHTN.set_up_goals(goal_data, _ID))
+        domain, tasks = domains[goal]
+
+        agent = CompactState('state', state.index, [_ID], array('i', row))
+        plan = domain.pyhop(agent, tasks, stats=stats)
+        if plan is False:
+            plans.update((ID, False) for ID in IDs)
+            continue
+        for task in plan:
+            domain.operators[task[0]](agent, *task[1:])
+        state.assign(IDs, agent.values)
+        for ID in IDs:
+            plans[ID] = [(task[0], ID) + tuple(task[2:]) for task in plan]
+
+    return plans
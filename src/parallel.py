@@ -0,0 +1,104 @@
+"""
+Search the alternatives of one crafting problem in parallel.
+
+pyhop.frontier splits the search tree at the first method nodes where more
+than one method applies (the top levels of OR branches) into independent
+subtrees. Each subtree is searched in its own worker process, against a
+domain the worker builds once from the same data (with the RecipeGraph from
+domain_cache):
+
+    plan = plan_parallel(data, 'agent', time=300, workers=4)
+
+The result is always the plan the sequential search would return. By
+default that is the first plan found, from the earliest subtree that has
+one: as soon as it is known, the workers searching later subtrees stop.
+With cost=True each subtree is searched for its cheapest plan, and the
+cheapest of those wins, the earliest subtree on ties.
+"""
+
+import concurrent.futures
+import multiprocessing
+
+import autoHTN
+import domain_cache
+
+# Nodes a worker searches between looks at whether an earlier subtree has already won
+SLICE = 1000
+
+# What _load built in this process: (domain, action_time, time_bound, index of the earliest subtree with a plan)
+_worker = None
+
+
+def _load(data, ID, options, winner):
+    global _worker
+    graph = domain_cache.load(data).graph
+    domain = autoHTN.make_domain(data, ID, compact=True, graph=graph, **options)
+    _worker = (domain, autoHTN.make_action_time(data), autoHTN.make_time_bound(data, ID, graph), winner)
+
+
+def _search(index, subproblem, cost):
+    # Returns (index, plan or False), or (index, None) if the search stopped because an earlier subtree won
+    domain, action_time, time_bound, winner = _worker
+    state, tasks, plan, depth, calling_stack = subproblem
+    if cost:
+        search = domain.anytime(state, tasks, action_time, time_bound, start=(plan, depth, calling_stack))
+    else:
+        search = domain.anytime(state, tasks, start=(plan, depth, calling_stack))
+
+    while not search.done():
+        if not cost and winner.value < index:
+            search.close()
+            return index, None
+        search.run(max_nodes=SLICE)
+    return index, search.plan
+
+
+def _decide(results, count, action_time=None):
+    # The plan the sequential search would return, False if there is none, or None while that isn't known yet
+    if action_time is None:
+        for index in range(count):
+            if index not in results:
+                return None
+            if results[index]:
+                return results[index]
+        return False
+
+    if len(results) < count:
+        return None
+    plans = [(sum(map(action_time, plan)), index) for index, plan in results.items() if plan]
+    return results[min(plans)[1]] if plans else False
+
+
+def plan_parallel(data, ID='agent', time=0, workers=None, levels=1, cost=False, **options):
+    """
+    Plan data['Goal'] for agent ID from data['Initial'] with time to spend,
+    searching the subtrees below the first levels OR branches in a pool of
+    workers processes. options are passed on to autoHTN.make_domain (lifted,
+    time_check, ...). Returns the plan make_domain(...).pyhop returns, or,
+    with cost=True, the plan pyhop_optimal returns with make_action_time and
+    make_time_bound; False if there is none.
+    """
+    domain = autoHTN.make_domain(data, ID, compact=True, graph=domain_cache.load(data).graph, **options)
+    state = autoHTN.set_up_compact_state(data, [ID], time=time)
+    subproblems = domain.frontier(state, autoHTN.set_up_goals(data, ID), levels)
+    action_time = autoHTN.make_action_time(data) if cost else None
+
+    winner = multiprocessing.Value('i', len(subproblems))
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=_load,
+                                                initargs=(data, ID, options, winner)) as pool:
+        futures = [pool.submit(_search, index, subproblem, cost) for index, subproblem in enumerate(subproblems)]
+        results = {}
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                index, plan = future.result()
+                results[index] = plan
+                if plan and not cost:
+                    with winner.get_lock():
+                        winner.value = min(winner.value, index)
+                plan = _decide(results, len(subproblems), action_time)
+                if plan is not None:
+                    return plan
+        finally:
+            for future in futures:
+                future.cancel()
+    return False
@@ -0,0 +1,197 @@
+"""
+Remember crafting plans between requests.
+
+A PlanCache answers plan(initial, goal, time) from a bounded LRU table keyed
+on the canonical form of the (Initial, Goal) pair, and searches only on a
+miss. Each entry records the budget the search had and the time its plan
+spends. The same plan is then the answer for any budget in between, since
+less time only takes branches away from the search. A search that failed
+is the answer for any smaller budget.
+
+Every search also records the steps that accomplished each ('have_enough',
+ID, item, num) task on the way to its plan, keyed by the inventory the task
+started from (time left out). Later searches try those steps first, as one
+more have_enough method, so a new goal that shares a subgoal with an old one
+reuses its subplan instead of searching for it again:
+
+    cache = PlanCache(data)
+    cache.load('plans.pickle')
+    plan = cache.plan({'plank': 1}, {'iron_pickaxe': 1}, 300)
+    cache.save('plans.pickle')
+"""
+
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+
+import autoHTN
+import domain_cache
+import pyhop
+
+# The agent ID plans are searched and cached under; plan() puts the caller's ID into the steps it returns
+_ID = 'agent'
+
+
+def canonical(initial, goal):
+    """
+    The key of a request: the items held, sorted and without the ones held
+    0 of, and the goal items in their own order, which is the order the
+    search works on them in.
+    """
+    return (tuple(sorted((item, num) for item, num in initial.items() if num)), tuple(goal.items()))
+
+
+class _SubplanMemo(pyhop.Memo):
+    def subplan_key(self, state, task):
+        # Slot 0 of a CompactState row is time, so this is the inventory alone: the same steps make the item from it
+        # whatever the time, as long as there is enough of it
+        if task[0] == 'have_enough':
+            return (state.values[1:].tobytes(), task[2], task[3])
+        return None
+
+
+def _low(entry):
+    # The smallest budget an answer (budget, spent, plan) is good for
+    budget, spent, plan = entry
+    return spent if plan is not False else 0
+
+
+class PlanCache(object):
+    """
+    Plans for the recipes in data. options are passed on to
+    autoHTN.make_domain (lifted, time_check, ...). At most maxsize answers
+    (a request has one for each range of budgets searched that no other
+    answer covers) and maxsize subplans are kept, the least recently used
+    dropped first. With splice=False the subplans are neither recorded nor
+    reused.
+    """
+
+    def __init__(self, data, maxsize=1000, splice=True, **options):
+        cached = domain_cache.load(data)
+        self.data = {name: data[name] for name in ('Items', 'Tools', 'Recipes')}
+        self.key = cached.key
+        self.index = cached.index
+        self.graph = cached.graph
+        self.action_time = autoHTN.make_action_time(data)
+        self.maxsize = maxsize
+        self.splice = splice
+        self.options = options
+        self.plans = OrderedDict()
+        self.answers = 0
+        self.subplans = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.splices = 0
+        self.evictions = 0
+
+    def plan(self, initial, goal, time, ID='agent'):
+        """
+        A plan for ID to reach goal (an {item: num} dict like a Goal) from
+        initial (like an Initial) within time, or False if there is none.
+        """
+        key = canonical(initial, goal)
+        plan = self._lookup(key, time)
+        if plan is None:
+            self.misses += 1
+            plan = self._search(initial, goal, time)
+            self._record(key, time, plan)
+        else:
+            self.hits += 1
+        if plan is False:
+            return False
+        return [(task[0], ID) + tuple(task[2:]) for task in plan]
+
+    def _lookup(self, key, time):
+        # The cached answer for time, or None
+        for budget, spent, plan in self.plans.get(key, ()):
+            if time <= budget and (plan is False or spent <= time):
+                self.plans.move_to_end(key)
+                return plan
+        return None
+
+    def _record(self, key, time, plan):
+        spent = sum(map(self.action_time, plan)) if plan is not False else None
+        # The answer is good for budgets from low to time; drop the ones it covers, which it answers just the same
+        low = spent if plan is not False else 0
+        entries = self.plans.pop(key, [])
+        kept = [entry for entry in entries if _low(entry) < low or entry[0] > time]
+        self.plans[key] = kept + [(time, spent, plan)]
+        self.answers += len(self.plans[key]) - len(entries)
+        self._trim()
+
+    def _trim(self):
+        # Drop the oldest answers of the least recently used requests until there are at most maxsize
+        while self.answers > self.maxsize:
+            key = next(iter(self.plans))
+            entries = self.plans[key]
+            entries.pop(0)
+            if not entries:
+                del self.plans[key]
+            self.answers -= 1
+            self.evictions += 1
+
+    def _search(self, initial, goal, time):
+        data = dict(self.data, Initial=initial, Goal=goal)
+        domain = autoHTN.make_domain(data, _ID, compact=True, graph=self.graph, **self.options)
+        state = autoHTN.set_up_compact_state(data, [_ID], time=time, index=self.index)
+        goals = autoHTN.set_up_goals(data, _ID)
+        if not self.splice:
+            return domain.pyhop(state, goals)
+
+        domain.declare_methods('have_enough', self._splice, *domain.methods['have_enough'])
+        memo = _SubplanMemo(self.maxsize, with_stack=True, subplans=True)
+        plan = domain.pyhop(state, goals, memo=memo)
+        for key, steps in memo.subplans.items():
+            if steps:
+                self.subplans[key] = steps
+                self.subplans.move_to_end(key)
+        while len(self.subplans) > self.maxsize:
+            self.subplans.popitem(last=False)
+        return plan
+
+    def _splice(self, state, ID, item, num):
+        # A have_enough method: the steps that made num item from this inventory before, if any
+        key = (state.values[1:].tobytes(), item, num)
+        steps = self.subplans.get(key)
+        if not steps:
+            return False
+        self.subplans.move_to_end(key)
+        self.splices += 1
+        return list(steps)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'splices': self.splices, 'evictions': self.evictions,
+                'plans': len(self.plans), 'answers': self.answers, 'subplans': len(self.subplans)}
+
+    def save(self, path):
+        """Write the cached plans and subplans to path, replacing it in one step."""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump({'key': self.key, 'plans': self.plans, 'subplans': self.subplans}, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+
+    def load(self, path):
+        """
+        Add the plans and subplans saved at path. Returns False, adding
+        nothing, if there is no such file, it can't be read, or it was saved
+        for other recipes.
+        """
+        try:
+            with open(path, 'rb') as f:
+                saved = pickle.load(f)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return False
+        if not isinstance(saved, dict) or saved.get('key') != self.key:
+            return False
+        for key, entries in saved['plans'].items():
+            if key not in self.plans:
+                self.plans[key] = list(entries)
+                self.answers += len(entries)
+        self._trim()
+        for key, steps in saved['subplans'].items():
+            self.subplans.setdefault(key, steps)
+        while len(self.subplans) > self.maxsize:
+            self.subplans.popitem(last=False)
+        return True
@@ -25,10 +25,18 @@ Pyhop provides the following classes and functions:
   To put variables and values into it, you should do assignments such as
   foo.var1 = val1
 
+- foo = UndoState('foo') is a drop-in replacement for State('foo'). Instead
+  of deep-copying the state before every operator, Pyhop applies operators
+  to it in place, journals every assignment, and rolls the journal back when
+  it backtracks. The state you pass to pyhop is left unchanged.
+
 - bar = Goal('bar') tells Pyhop to create an empty goal object named 'bar'.
   To put variables and values into it, you should do assignments such as
   bar.var1 = val1
 
+- state_key(foo) returns a hashable canonical form of the state foo; two
+  states with the same variable bindings have equal keys.
+
 - print_state(foo) will print the variables and values in the state foo.
 
 - print_goal(foo) will print the variables and values in the goal foo.
@@ -45,9 +53,49 @@ Pyhop provides the following classes and functions:
 
 - print_methods() will print out a list of all declared methods.
 
+- dom = Domain('dom') creates a domain with its own operators, methods and
+  checks. It has the same declare_operators, declare_methods, add_check,
+  pyhop and pyhop_optimal as this module, which uses default_domain.
+
 - pyhop(state1,tasklist) tells Pyhop to find a plan for accomplishing tasklist
   (a list of tasks), starting from an initial state state1, using whatever
-  methods and operators you declared previously.
+  methods and operators you declared previously. It searches with an
+  explicit stack (seek_plan_iterative), so there is no recursion limit on
+  plan depth; the recursive seek_plan returns the same plans.
+
+- pyhop_optimal(state1,tasklist,action_cost) is like pyhop, but keeps
+  searching until it has the plan with the least total action_cost, and
+  returns (plan, cost, nodes expanded).
+
+- search = AnytimeSearch(state1,tasklist) is a search that can be run a
+  little at a time: search.run(seconds=...,max_nodes=...) searches until
+  the budget runs out and returns the best plan found so far with a status
+  of SOLVED, FAILED or BUDGET_EXHAUSTED; calling run again resumes it.
+
+- stream_plan(state1,tasklist) generates the steps of the plan pyhop would
+  return while it is still searching, each as soon as no backtracking can
+  take it back, so that they can be carried out before the search ends.
+
+- Checks get the tasks of a node as an Agenda, its plan as a PlanSteps and
+  its calling stack as a CallingStack. These are persistent linked lists,
+  which the search pushes onto and pops from in O(1) without copying, and
+  which read like lists for checks written against lists. They also keep
+  running totals: tasks.total(*key) sums pending amounts,
+  `task in calling_stack` and calling_stack.count(task) take O(1), and
+  calling_stack.run counts repeats at the top.
+
+- domain.nogoods = Nogoods() makes the searches on a domain remember the
+  nodes that failed, so that later searches, including later pyhop calls,
+  fail at them at once. Subclasses of Nogoods can generalize a failure to
+  every node with less of some budget, such as time.
+
+- frontier(state1,tasklist,levels) splits the search into independent
+  subproblems, in the order pyhop would search them, so that they can be
+  searched separately (for example in parallel) with iter_plans(...,start=).
+
+- stats = SearchStats() passed to pyhop(...,stats=stats) counts nodes,
+  backtracks, method attempts, check firings and operator time during the
+  search; stats.to_json() and stats.folded() export them.
 
 - In the above call to pyhop, you can add an optional 3rd argument called
   'verbose' that tells pyhop how much debugging printout it should provide:
@@ -96,7 +144,9 @@ Pyhop provides the following classes and functions:
 
 
 from __future__ import print_function
-import copy,sys, pprint
+import copy,sys, pprint, time, json
+from operator import length_hint
+from collections import OrderedDict, Counter
 
 ############################################################
 # States and goals
@@ -111,13 +161,128 @@ class Goal():
     def __init__(self,name):
         self.__name__ = name
 
+_MISSING = object()
+
+class _LoggedDict(dict):
+    """A dict that records the previous value of every key it overwrites."""
+    __slots__ = ('_journal',)
+    def __init__(self,items,journal):
+        dict.__init__(self)
+        self._journal = journal
+        for (key,val) in items.items():
+            dict.__setitem__(self,key,_logged(val,journal))
+    def __setitem__(self,key,val):
+        self._journal.append((self,key,dict.get(self,key,_MISSING)))
+        dict.__setitem__(self,key,_logged(val,self._journal))
+    def __delitem__(self,key):
+        self._journal.append((self,key,dict.__getitem__(self,key)))
+        dict.__delitem__(self,key)
+    # The other ways to change a dict, each through __setitem__ and __delitem__ so that they are journaled too
+    def update(self,*args,**kwargs):
+        for (key,val) in dict(*args,**kwargs).items():
+            self[key] = val
+    def setdefault(self,key,default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+    def pop(self,key,*default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        val = self[key]
+        del self[key]
+        return val
+    def popitem(self):
+        if not self:
+            raise KeyError('popitem(): dictionary is empty')
+        key = next(reversed(self))
+        return (key,self.pop(key))
+    def clear(self):
+        for key in list(self):
+            del self[key]
+    def __ior__(self,other):
+        self.update(other)
+        return self
+    def __deepcopy__(self,memo):
+        return copy.deepcopy(_plain(self),memo)
+
+def _logged(val,journal):
+    if isinstance(val,dict) and not (isinstance(val,_LoggedDict) and val._journal is journal):
+        return _LoggedDict(val,journal)
+    return val
+
+def _plain(val):
+    if isinstance(val,_LoggedDict):
+        return {key:_plain(x) for (key,x) in val.items()}
+    return val
+
+class UndoState(State):
+    """
+    A state whose changes can be rolled back. Dict-valued variables (at any
+    nesting level) are journaled, so operators written for State, such as
+    state.time[ID] -= 1, keep working unchanged.
+    """
+    __slots__ = ('_journal',)
+    def __init__(self,name):
+        object.__setattr__(self,'_journal',[])
+        State.__init__(self,name)
+        del self._journal[:]
+    def __setattr__(self,name,val):
+        self._journal.append((self.__dict__,name,self.__dict__.get(name,_MISSING)))
+        self.__dict__[name] = _logged(val,self._journal)
+    def __delattr__(self,name):
+        self._journal.append((self.__dict__,name,self.__dict__[name]))
+        del self.__dict__[name]
+    def __deepcopy__(self,memo):
+        new = UndoState(self.__name__)
+        for (name,val) in vars(self).items():
+            setattr(new,name,copy.deepcopy(_plain(val),memo))
+        del new._journal[:]
+        return new
+    def mark(self):
+        """Return a marker for the current point in the journal."""
+        return len(self._journal)
+    def rollback(self,mark):
+        """Undo every change made since mark was taken."""
+        journal = self._journal
+        while len(journal) > mark:
+            (target,key,old) = journal.pop()
+            if old is _MISSING:
+                dict.__delitem__(target,key)
+            else:
+                dict.__setitem__(target,key,old)
+
 
 ### print_state and print_goal are identical except for the name
 
+def _variables(state):
+    # States that don't keep their variables in __dict__ can provide as_dict()
+    if hasattr(state,'as_dict'):
+        return state.as_dict()
+    return vars(state)
+
+def _freeze(val):
+    if isinstance(val,dict):
+        return tuple(sorted((key,_freeze(x)) for (key,x) in val.items()))
+    if isinstance(val,list):
+        return tuple(_freeze(x) for x in val)
+    return val
+
+def state_key(state):
+    """
+    Return a hashable key for state. States that can do this cheaply (such as
+    inventory.CompactState) provide key(); otherwise every variable except
+    __name__ is frozen into sorted tuples.
+    """
+    if hasattr(state,'key'):
+        return state.key()
+    return tuple(sorted((name,_freeze(val)) for (name,val) in vars(state).items() if name != '__name__'))
+
 def print_state(state,indent=4):
     """Print each variable in state, indented by indent spaces."""
     if state != False:
-        for (name,val) in vars(state).items():
+        for (name,val) in _variables(state).items():
             if name != '__name__':
                 for x in range(indent): sys.stdout.write(' ')
                 sys.stdout.write(state.__name__ + '.' + name)
@@ -155,8 +320,50 @@ def find_if(cond,seq):
 ############################################################
 # Commands to tell Pyhop what the operators and methods are
 
-operators = {}
-methods = {}
+class Domain(object):
+    """
+    The operators, methods and checks of one planning domain. Build it once
+    and plan with it as often as you like; a Domain shares nothing with any
+    other, so several can be used side by side in threads or processes.
+    The module-level declare_* functions and pyhop() use default_domain.
+    - Domain(name, operators, methods) starts from (and shares) existing
+      operator and method tables, with no checks of its own.
+    - nogoods, None by default, can be set to a Nogoods for searches on the
+      domain to learn dead ends in, and skip them in later searches.
+    """
+    def __init__(self,name='domain',operators=None,methods=None):
+        self.__name__ = name
+        self.operators = {} if operators is None else operators
+        self.methods = {} if methods is None else methods
+        self.checks = []
+        self.nogoods = None
+    def declare_operators(self,*op_list):
+        self.operators.update({op.__name__:op for op in op_list})
+        return self.operators
+    def declare_methods(self,task_name,*method_list):
+        self.methods.update({task_name:list(method_list)})
+        return self.methods[task_name]
+    def add_check(self,func):
+        self.checks.append(func)
+    def print_operators(self):
+        print_operators(self.operators)
+    def print_methods(self):
+        print_methods(self.methods)
+    def pyhop(self,state,tasks,verbose=0,memo=None,stats=None):
+        return pyhop(state,tasks,verbose,memo,self,stats)
+    def pyhop_optimal(self,state,tasks,action_cost,lower_bound=None,verbose=0,transpositions=None,stats=None):
+        return pyhop_optimal(state,tasks,action_cost,lower_bound,verbose,transpositions,self,stats)
+    def iter_plans(self,state,tasks,verbose=0,memo=None,action_cost=None,prune=None,pause=None,stats=None,start=None):
+        return iter_plans(state,tasks,verbose,memo,action_cost,prune,self,pause,stats,start)
+    def anytime(self,state,tasks,action_cost=None,lower_bound=None,verbose=0,memo=None,transpositions=None,stats=None,
+                start=None):
+        return AnytimeSearch(state,tasks,action_cost,lower_bound,verbose,memo,transpositions,self,stats,start)
+    def frontier(self,state,tasks,levels=1):
+        return frontier(state,tasks,levels,self)
+
+default_domain = Domain('default')
+operators = default_domain.operators
+methods = default_domain.methods
 
 def declare_operators(*op_list):
     """
@@ -176,7 +383,7 @@ def declare_methods(task_name, *method_list):
     return methods[task_name]
 
 # start cm146 modification
-checks = []
+checks = default_domain.checks
 def add_check(func):
     checks.append(func)
 # end cm146 modification
@@ -194,19 +401,316 @@ def print_methods(mlist=methods):
     for task in mlist:
         print('{:<14}'.format(task) + ', '.join([f.__name__ for f in mlist[task]]))
 
+############################################################
+# Memoizing search results
+
+FAILED = 'FAILED'
+
+class Memo(object):
+    """
+    A transposition table for seek_plan_iterative: a bounded LRU map from
+    (state_key(state), remaining tasks) to FAILED, or, if solutions is True,
+    to the plan suffix that solved them. A node found in it is not searched
+    again, so the table may be kept across pyhop calls on the same domain.
+
+    Checks can depend on the calling stack and depth as well as the state,
+    so a failure caused by a check is only exact for the same context. Pass
+    with_stack=True to add the calling stack to the key.
+
+    With subplans=True, every plan found also fills subplans: for each node
+    on the way to it, subplan_key(state,first task) maps to the steps that
+    accomplished that first task. It is bounded by maxsize too.
+    """
+    def __init__(self,maxsize=100000,solutions=False,with_stack=False,subplans=False):
+        self.maxsize = maxsize
+        self.solutions = solutions
+        self.with_stack = with_stack
+        self.subplans = OrderedDict() if subplans else None
+        self.table = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    def key(self,state,tasks,calling_stack):
+        if self.with_stack:
+            return (state_key(state),tuple(tasks),tuple(calling_stack))
+        return (state_key(state),tuple(tasks))
+    def subplan_key(self,state,task):
+        return (state_key(state),task)
+    def record_subplan(self,key,steps):
+        self.subplans[key] = steps
+        self.subplans.move_to_end(key)
+        if len(self.subplans) > self.maxsize:
+            self.subplans.popitem(last=False)
+    def lookup(self,key):
+        """Return FAILED, a plan suffix, or None if key isn't in the table."""
+        result = self.table.get(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.table.move_to_end(key)
+        return result
+    def record(self,key,result):
+        self.table[key] = result
+        self.table.move_to_end(key)
+        if len(self.table) > self.maxsize:
+            self.table.popitem(last=False)
+            self.evictions += 1
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / float(lookups) if lookups else 0.0
+    def stats(self):
+        return {'hits':self.hits, 'misses':self.misses, 'evictions':self.evictions,
+                'size':len(self.table), 'hit_rate':self.hit_rate()}
+
+class Nogoods(object):
+    """
+    Dead ends learned by iter_plans (and so pyhop) on a domain whose
+    nogoods this is, kept across searches. key(state,tasks,calling_stack)
+    splits a node into (key, budget): a node fails if a node with the same
+    key failed with at least as much budget. Every node is looked up before
+    its operator or methods are tried, and recorded when it fails.
+
+    The key here is the whole node, with no budget. Subclasses can leave
+    out of the key what the search below a node doesn't depend on, and
+    make budget a quantity, such as time left, that the operators, methods
+    and checks never do better with less of. Nogoods are not learned in
+    searches with prune (branch and bound), since cut branches are not
+    failures.
+    """
+    def __init__(self,maxsize=100000):
+        self.maxsize = maxsize
+        self.table = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    def key(self,state,tasks,calling_stack):
+        return ((state_key(state),tuple(tasks),tuple(calling_stack)),0)
+    def fails(self,key,budget):
+        """Whether a node with key and budget is known to fail."""
+        bound = self.table.get(key)
+        if bound is None or budget > bound:
+            self.misses += 1
+            return False
+        self.hits += 1
+        self.table.move_to_end(key)
+        return True
+    def record(self,key,budget):
+        bound = self.table.get(key)
+        if bound is None or budget > bound:
+            self.table[key] = budget
+        self.table.move_to_end(key)
+        if len(self.table) > self.maxsize:
+            self.table.popitem(last=False)
+            self.evictions += 1
+    def stats(self):
+        return {'hits':self.hits, 'misses':self.misses, 'evictions':self.evictions, 'size':len(self.table)}
+
+############################################################
+# Instrumenting the search
+
+class SearchStats(object):
+    """
+    Counters filled in by iter_plans (and so pyhop, pyhop_optimal and
+    AnytimeSearch) when passed as stats=. Everything is keyed by name:
+    - nodes: nodes entered
+    - backtracks[task name]: nodes abandoned without a plan, by first task
+    - method_attempts[method] and method_successes[method]: calls of each
+      method, and the ones that returned subtasks rather than False
+    - check_fires[check]: times each check pruned a node
+    - operator_calls[op], operator_failures[op] and operator_seconds[op]:
+      applications of each operator, the ones that returned False, and the
+      wall-clock time spent in them
+    - stacks[(task names)]: with stacks=True, nodes entered under each
+      calling stack, for folded(). This costs O(depth) per node.
+    The same SearchStats can be passed to several searches to add them up.
+    """
+    def __init__(self,stacks=False):
+        self.nodes = 0
+        self.backtracks = Counter()
+        self.method_attempts = Counter()
+        self.method_successes = Counter()
+        self.check_fires = Counter()
+        self.operator_calls = Counter()
+        self.operator_failures = Counter()
+        self.operator_seconds = Counter()
+        self.stacks = Counter() if stacks else None
+    def enter(self,tasks,calling_stack):
+        self.nodes += 1
+        if self.stacks is not None:
+            names = tuple(task[0] for task in calling_stack)
+            self.stacks[names + (tasks[0][0],) if tasks else names] += 1
+    def as_dict(self):
+        return {'nodes':self.nodes,
+                'backtracks':dict(self.backtracks),
+                'method_attempts':dict(self.method_attempts),
+                'method_successes':dict(self.method_successes),
+                'check_fires':dict(self.check_fires),
+                'operator_calls':dict(self.operator_calls),
+                'operator_failures':dict(self.operator_failures),
+                'operator_seconds':dict(self.operator_seconds)}
+    def to_json(self,**kwargs):
+        return json.dumps(self.as_dict(),**kwargs)
+    def folded(self):
+        """
+        Node counts per calling stack in the folded format of flamegraph.pl
+        and speedscope, one 'task;subtask;... count' line per stack.
+        """
+        if self.stacks is None:
+            raise ValueError('SearchStats(stacks=True) is needed for folded()')
+        return '\n'.join('{} {}'.format(';'.join(names),count) for names,count in sorted(self.stacks.items()))
+
 ############################################################
 # The actual planner
 
-def pyhop(state,tasks,verbose=0):
+def pyhop(state,tasks,verbose=0,memo=None,domain=None,stats=None):
     """
     Try to find a plan that accomplishes tasks in state. 
     If successful, return the plan. Otherwise return False.
+    memo is an optional Memo of subproblems already known to fail or succeed.
+    domain is the Domain to plan in, default_domain if it isn't given.
+    stats is an optional SearchStats to count the search in.
     """
     if verbose>0: print('** pyhop, verbose={}: **\n   state = {}\n   tasks = {}'.format(verbose, state.__name__, tasks))
-    result = seek_plan(state,tasks,[],0,verbose)
+    if isinstance(state,UndoState):
+        mark = state.mark()
+        try:
+            result = seek_plan_iterative(state,tasks,verbose,memo,domain,stats)
+        finally:
+            state.rollback(mark)
+    else:
+        result = seek_plan_iterative(state,tasks,verbose,memo,domain,stats)
     if verbose>0: print('** result =',result,'\n')
     return result
 
+def pyhop_optimal(state,tasks,action_cost,lower_bound=None,verbose=0,transpositions=None,domain=None,stats=None):
+    """
+    Find the plan with the least total action_cost(task) among all the plans
+    pyhop could find, by depth-first branch and bound over iter_plans.
+    - If given, lower_bound(state,tasks) must never overestimate the cost
+      of accomplishing tasks in state; nodes that can't beat the best plan
+      so far are cut.
+    - transpositions is a Memo of the cheapest cost each (state, tasks) was
+      reached with; a node reached again at no lower cost is cut. A fresh
+      one is used if it isn't given.
+    - domain and stats are as in pyhop.
+    Return (plan, cost, nodes expanded), or (False, None, nodes expanded).
+    """
+    if verbose>0: print('** pyhop_optimal, verbose={}: **\n   state = {}\n   tasks = {}'.format(verbose, state.__name__, tasks))
+    search = AnytimeSearch(state,tasks,action_cost,lower_bound,verbose,None,transpositions,domain,stats)
+    search.run()
+    if verbose>0: print('** result =',search.plan,'cost =',search.cost,'nodes =',search.nodes,'\n')
+    return (search.plan,search.cost,search.nodes)
+
+SOLVED = 'SOLVED'
+BUDGET_EXHAUSTED = 'BUDGET_EXHAUSTED'
+
+class AnytimeSearch(object):
+    """
+    A search that can be run in slices, for callers such as a game loop that
+    can only spare a frame's worth of time at once. Each call of
+    run(seconds,max_nodes) searches until it finishes or the budget runs out,
+    and returns result(); the next call carries on where the last one
+    stopped. result()['status'] is
+    - SOLVED: the search is over and plan is the answer: the first plan
+      found, or with action_cost, the cheapest one (as in pyhop_optimal);
+    - FAILED: the search is over and there is no plan;
+    - BUDGET_EXHAUSTED: the search can be resumed; plan is the best plan
+      found so far, or False.
+    Without action_cost the search stops at the first plan, as pyhop does;
+    with it, the search is branch and bound as described in pyhop_optimal,
+    and lower_bound and transpositions are as there. memo is as in pyhop and
+    can only be used without action_cost, since cut branches are not failures.
+    stats is as in pyhop, and start as in iter_plans.
+    An UndoState is changed while the search is suspended, and rolled back
+    when it finishes or close() is called.
+    """
+    def __init__(self,state,tasks,action_cost=None,lower_bound=None,verbose=0,memo=None,transpositions=None,domain=None,
+                 stats=None,start=None):
+        if action_cost is not None and memo is not None:
+            raise ValueError('memo cannot be combined with action_cost')
+        self.state = state
+        self.action_cost = action_cost
+        self.lower_bound = lower_bound
+        self.verbose = verbose
+        self.transpositions = transpositions if transpositions is not None or action_cost is None else Memo()
+        self.status = None
+        self.plan = False
+        self.cost = None
+        self.plans_found = 0
+        self.nodes = 0
+        self.elapsed = 0.0
+        self._limit = None
+        self._deadline = None
+        self._closed = False
+        self._mark = state.mark() if isinstance(state,UndoState) else None
+        prune = self._prune if action_cost is not None else None
+        self._plans = iter_plans(state,tasks,verbose,memo,action_cost,prune,domain,self._pause,stats,start)
+    def done(self):
+        return self.status in (SOLVED,FAILED)
+    def run(self,seconds=None,max_nodes=None):
+        """
+        Search for at most seconds of wall-clock time and max_nodes more
+        nodes (no limit if None). After close() it searches no more.
+        """
+        if self.done() or self._closed:
+            return self.result()
+        start = time.perf_counter()
+        self._deadline = start+seconds if seconds is not None else None
+        self._limit = self.nodes+max_nodes if max_nodes is not None else None
+        self.status = BUDGET_EXHAUSTED
+        try:
+            for plan in self._plans:
+                if plan is PAUSED:
+                    break
+                self.plans_found += 1
+                self.plan = plan
+                if self.action_cost is None:
+                    self._finish(SOLVED)
+                    break
+                self.cost = sum(self.action_cost(task) for task in plan)
+                if self.verbose>0: print('** found plan with cost',self.cost)
+            else:
+                self._finish(SOLVED if self.plan is not False else FAILED)
+        except BaseException:
+            self.close()
+            raise
+        finally:
+            self.elapsed += time.perf_counter()-start
+        return self.result()
+    def result(self):
+        return {'status':self.status, 'plan':self.plan, 'cost':self.cost, 'plans_found':self.plans_found,
+                'nodes':self.nodes, 'seconds':self.elapsed}
+    def close(self):
+        """Give up on the search, keeping the best plan so far."""
+        if not self.done():
+            self._finish(self.status)
+    def _finish(self,status):
+        self.status = status
+        self._closed = True
+        self._plans.close()
+        if self._mark is not None:
+            self.state.rollback(self._mark)
+            self._mark = None
+    def _pause(self):
+        if self._limit is not None and self.nodes >= self._limit:
+            return True
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            return True
+        self.nodes += 1
+        return False
+    def _prune(self,state,tasks,cost,calling_stack):
+        if self.cost is not None:
+            bound = cost + self.lower_bound(state,tasks) if self.lower_bound is not None else cost
+            if bound >= self.cost:
+                return True
+        key = self.transpositions.key(state,tasks,calling_stack)
+        cheapest = self.transpositions.lookup(key)
+        if cheapest is not None and cheapest <= cost:
+            return True
+        self.transpositions.record(key,cost)
+        return False
+
 # cm146 modification: add calling stack as parameter
 def seek_plan(state,tasks,plan,depth,verbose=0,calling_stack=[]):
     """
@@ -214,25 +718,36 @@ def seek_plan(state,tasks,plan,depth,verbose=0,calling_stack=[]):
     - plan is the current partial plan.
     - depth is the recursion depth, for use in debugging
     - verbose is whether to print debugging messages
-    # """
-    # print (tasks)
+    """
+    if not isinstance(tasks,Agenda):
+        tasks = Agenda.of(tasks)
+    if not isinstance(plan,PlanSteps):
+        plan = PlanSteps.of(plan)
+    if not isinstance(calling_stack,CallingStack):
+        calling_stack = CallingStack.of(calling_stack)
     if verbose>1: print('depth {} tasks {}'.format(depth,tasks))
     if tasks == []:
         if verbose>2: print('depth {} returns plan {}'.format(depth,plan))
-        return plan
+        return plan.tolist()
     task1 = tasks[0]
 
     if task1[0] in operators:
         if verbose>2: print('depth {} action {}'.format(depth,task1))
         operator = operators[task1[0]]
-        newstate = operator(copy.deepcopy(state),*task1[1:])
+        if isinstance(state,UndoState):
+            mark = state.mark()
+            newstate = operator(state,*task1[1:])
+        else:
+            newstate = operator(copy.deepcopy(state),*task1[1:])
         if verbose>2:
             print('depth {} new state:'.format(depth))
             print_state(newstate)
         if newstate:
-            solution = seek_plan(newstate,tasks[1:],plan+[task1],depth+1,verbose,calling_stack)
+            solution = seek_plan(newstate,tasks.after([]),plan.extend(task1),depth+1,verbose,calling_stack)
             if solution != False:
                 return solution
+        if isinstance(state,UndoState):
+            state.rollback(mark)
 
     # start cm146 modification
     for check in checks:
@@ -249,8 +764,554 @@ def seek_plan(state,tasks,plan,depth,verbose=0,calling_stack=[]):
             if verbose>2:
                 print('depth {} new tasks: {}'.format(depth,subtasks))
             if subtasks != False:
-                solution = seek_plan(state,subtasks+tasks[1:],plan,depth+1,verbose,calling_stack+[task1])
+                solution = seek_plan(state,tasks.after(subtasks),plan,depth+1,verbose,calling_stack.push(task1))
                 if solution != False:
                     return solution
     if verbose>2: print('depth {} returns failure'.format(depth))
     return False
+
+def _amount(task):
+    # The amount a task asks for, if its last argument is one, as in ('have_enough', ID, item, num)
+    if len(task) > 2 and type(task[-1]) is int:
+        return task[-1]
+    return None
+
+def _count(totals,task,sign):
+    amount = _amount(task)
+    if amount is not None:
+        key = task[:-1]
+        total = totals.get(key,0) + sign*amount
+        if total:
+            totals[key] = total
+        else:
+            del totals[key]
+
+def _count_task(counter,task,sign):
+    counter[task] += sign
+
+class _Tally(object):
+    """
+    Totals over the tasks of a persistent list (an Agenda or a CallingStack),
+    shared by every list with the same end. They are kept for one list at a
+    time, current; at(cell) moves them to another by taking off and adding
+    the tasks in between, which is O(1) when lists are asked about in search
+    order. add(totals,task,sign) counts a task in or out.
+    """
+    __slots__ = ('totals','current','add')
+    def __init__(self,end,totals,add):
+        self.totals = totals
+        self.current = end
+        self.add = add
+    def at(self,cell):
+        current = self.current
+        if cell is current:
+            return self.totals
+        (totals,add,added,target) = (self.totals,self.add,[],cell)
+        while cell.length > current.length:
+            added.append(cell.task)
+            cell = cell.rest
+        while current.length > cell.length:
+            add(totals,current.task,-1)
+            current = current.rest
+        while current is not cell:
+            add(totals,current.task,-1)
+            current = current.rest
+            added.append(cell.task)
+            cell = cell.rest
+        for task in added:
+            add(totals,task,1)
+        self.current = target
+        return totals
+
+class Agenda(object):
+    """
+    The tasks of a node as a persistent linked list: each Agenda holds its
+    first task and the Agenda of the rest, which it shares with every other
+    agenda that ends the same way, so after() costs only the subtasks it
+    adds. It reads like the list of its tasks (len, iteration, indexing, +
+    and == with lists), though only len and [0] are O(1).
+    For checks, tasks.total(*key) is the sum of the last argument of every
+    task whose last argument is a number and whose other arguments are key.
+    So tasks.total('have_enough',ID,'wood') is how much wood the pending
+    have_enough tasks of ID ask for. The totals are a _Tally, shared by the
+    agendas of one search, so Agenda.of starts a new one every time.
+    """
+    __slots__ = ('task','rest','length','tally')
+    def __init__(self,task=None,rest=None):
+        self.task = task
+        self.rest = rest
+        if rest is None:
+            (self.length,self.tally) = (0,_Tally(self,{},_count))
+        else:
+            (self.length,self.tally) = (rest.length+1,rest.tally)
+    @staticmethod
+    def of(tasks):
+        agenda = Agenda()
+        for task in reversed(list(tasks)):
+            agenda = Agenda(task,agenda)
+        return agenda
+    def total(self,*key):
+        return self.tally.at(self).get(key,0)
+    def after(self,subtasks):
+        """The Agenda with the first task replaced by subtasks."""
+        agenda = self.rest
+        for task in reversed(subtasks):
+            agenda = Agenda(task,agenda)
+        return agenda
+    def tolist(self):
+        tasks = []
+        agenda = self
+        while agenda.length:
+            tasks.append(agenda.task)
+            agenda = agenda.rest
+        return tasks
+    def __len__(self):
+        return self.length
+    def __iter__(self):
+        agenda = self
+        while agenda.length:
+            yield agenda.task
+            agenda = agenda.rest
+    def __getitem__(self,i):
+        if i == 0 and self.length > 0:
+            return self.task
+        return self.tolist()[i]
+    def __add__(self,other):
+        return self.tolist()+list(other)
+    def __radd__(self,other):
+        return list(other)+self.tolist()
+    def __eq__(self,other):
+        if isinstance(other,(Agenda,list)):
+            return len(self) == len(other) and self.tolist() == list(other)
+        return NotImplemented
+    def __ne__(self,other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+    __hash__ = None
+    def __repr__(self):
+        return 'Agenda({!r})'.format(self.tolist())
+
+class CallingStack(object):
+    """
+    A calling stack as a persistent linked list: push(task) returns the
+    stack with task on top in O(1), sharing this one, its rest. It reads
+    like the list of its tasks, bottom first (len, iteration, indexing, +
+    and == with lists), though only len and [-1] are O(1). For checks:
+    - `task in stack` and stack.count(task) come from a multiset of the
+      tasks, a _Tally like the totals of an Agenda.
+    - stack.run is how many tasks in a row at the top equal the top one.
+    Each search starts from its own CallingStack(), so that searches in
+    other threads have their own multiset.
+    """
+    __slots__ = ('task','rest','length','run','tally')
+    def __init__(self,task=None,rest=None):
+        self.task = task
+        self.rest = rest
+        if rest is None:
+            (self.length,self.run,self.tally) = (0,0,_Tally(self,Counter(),_count_task))
+        else:
+            self.length = rest.length+1
+            self.run = rest.run+1 if rest.length and rest.task == task else 1
+            self.tally = rest.tally
+    @staticmethod
+    def of(tasks):
+        stack = CallingStack()
+        for task in tasks:
+            stack = stack.push(task)
+        return stack
+    def push(self,task):
+        return CallingStack(task,self)
+    def count(self,task):
+        return self.tally.at(self)[task]
+    def __contains__(self,task):
+        return self.count(task) > 0
+    def tolist(self):
+        tasks = []
+        stack = self
+        while stack.length:
+            tasks.append(stack.task)
+            stack = stack.rest
+        tasks.reverse()
+        return tasks
+    def __len__(self):
+        return self.length
+    def __iter__(self):
+        return iter(self.tolist())
+    def __getitem__(self,i):
+        if i == -1 and self.length > 0:
+            return self.task
+        return self.tolist()[i]
+    def __add__(self,other):
+        return self.tolist()+list(other)
+    def __eq__(self,other):
+        if isinstance(other,(CallingStack,list)):
+            return self.tolist() == list(other)
+        return NotImplemented
+    def __ne__(self,other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+    __hash__ = None
+    def __repr__(self):
+        return 'CallingStack({!r})'.format(self.tolist())
+
+class PlanSteps(object):
+    """
+    A plan as a persistent linked list, for the search to extend in O(1):
+    each PlanSteps holds its last task and the PlanSteps before it, which is
+    shared with every other plan that starts the same way. It reads like the
+    list of its tasks: len, iteration, indexing, + and == with lists work,
+    though only len and [-1] are O(1). EMPTY_PLAN has no tasks.
+    """
+    __slots__ = ('task','previous','length')
+    def __init__(self,task=None,previous=None):
+        self.task = task
+        self.previous = previous
+        self.length = previous.length+1 if previous is not None else 0
+    @staticmethod
+    def of(tasks):
+        plan = EMPTY_PLAN
+        for task in tasks:
+            plan = plan.extend(task)
+        return plan
+    def extend(self,task):
+        return PlanSteps(task,self)
+    def since(self,n):
+        """The list of tasks after the first n."""
+        tasks = []
+        plan = self
+        while plan.length > n:
+            tasks.append(plan.task)
+            plan = plan.previous
+        tasks.reverse()
+        return tasks
+    def tolist(self):
+        return self.since(0)
+    def __len__(self):
+        return self.length
+    def __iter__(self):
+        return iter(self.tolist())
+    def __getitem__(self,i):
+        if i == -1 and self.length > 0:
+            return self.task
+        return self.tolist()[i]
+    def __add__(self,other):
+        return self.tolist()+list(other)
+    def __eq__(self,other):
+        if isinstance(other,(PlanSteps,list)):
+            return self.tolist() == list(other)
+        return NotImplemented
+    def __ne__(self,other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+    __hash__ = None
+    def __repr__(self):
+        return 'PlanSteps({!r})'.format(self.tolist())
+
+EMPTY_PLAN = PlanSteps()
+
+class _Choice(object):
+    """
+    A choice point for seek_plan_iterative: one call of seek_plan, with the
+    method alternatives it has not tried yet.
+    - mark is the UndoState journal position to roll back to when the
+      choice point is abandoned, or None if it changed nothing.
+    - alternatives is None until its operator branch (if any) has failed.
+    - plan is a PlanSteps.
+    - cost is the summed action_cost of plan.
+    - nogood is the (key,budget) pair of its entry in Nogoods, if any.
+    - solved is whether a plan has been generated below it.
+    """
+    __slots__ = ('state','tasks','plan','depth','calling_stack','mark','alternatives','key','subkey','nogood','cost',
+                 'solved')
+    def __init__(self,state,tasks,plan,depth,calling_stack,mark=None,cost=0):
+        self.state = state
+        self.tasks = tasks
+        self.plan = plan
+        self.depth = depth
+        self.calling_stack = calling_stack
+        self.mark = mark
+        self.alternatives = None
+        self.key = None
+        self.subkey = None
+        self.nogood = None
+        self.cost = cost
+        self.solved = False
+
+def seek_plan_iterative(state,tasks,verbose=0,memo=None,domain=None,stats=None):
+    """
+    Non-recursive version of seek_plan. It visits the same nodes in the same
+    order and calls operators, checks and methods with the same arguments,
+    so it returns the same plan, but it keeps its choice points on a list
+    instead of the Python call stack. memo, domain and stats are as in pyhop.
+    """
+    for plan in iter_plans(state,tasks,verbose,memo,None,None,domain,None,stats):
+        return plan
+    return False
+
+PAUSED = 'PAUSED'
+
+def iter_plans(state,tasks,verbose=0,memo=None,action_cost=None,prune=None,domain=None,pause=None,stats=None,start=None,
+               commit=None):
+    """
+    Generate every plan seek_plan_iterative can find, in the order it would
+    find them. The first one is the plan pyhop returns.
+    - action_cost(task) gives the cost of an action; each plan's cost is
+      the sum, and is what prune sees.
+    - prune(state,tasks,cost,calling_stack) is called on entering every
+      node, with the cost of the plan so far; if it returns True the node
+      is skipped.
+    - pause() is called on entering every node, before prune; while it
+      returns True, PAUSED is generated instead of a plan, so the caller
+      can stop pulling from the generator and resume it later.
+    - stats is an optional SearchStats to count the search in.
+    - start is (plan,depth,calling_stack) to search from a node inside a
+      bigger search, such as one from frontier(), instead of from the top.
+      The plans generated start with its plan.
+    - commit(plan) is called on entering a node, before pause, when every
+      choice point above it has run out of alternatives and its plan (a
+      PlanSteps) is longer than the last one committed. Every plan still
+      to be generated starts with it.
+    Operators extend the plan in O(1) as a PlanSteps; checks see the
+    PlanSteps, and each plan generated is a list. Dead ends are looked up
+    in and added to domain.nogoods, unless it is None or prune is given.
+    memo cannot be combined with prune, since cut branches are not failures;
+    nodes on the way to a plan generated are not recorded as failures in it
+    either, when the search goes on past the plan and finds no other.
+    """
+    if memo is not None and prune is not None:
+        raise ValueError('memo cannot be combined with prune')
+    return _iter_plans(state,tasks,verbose,memo,action_cost,prune,domain,pause,stats,start,commit)
+
+def _iter_plans(state,tasks,verbose,memo,action_cost,prune,domain,pause,stats,start,commit):
+    if domain is None:
+        domain = default_domain
+    (operators,methods,checks) = (domain.operators,domain.methods,domain.checks)
+    nogoods = domain.nogoods if prune is None else None
+    undo = isinstance(state,UndoState)
+    stack = []
+    if start is None:
+        node = _Choice(state,Agenda.of(tasks),EMPTY_PLAN,0,CallingStack())
+    else:
+        (plan,depth,calling_stack) = start
+        cost = sum(action_cost(task) for task in plan) if action_cost is not None else 0
+        node = _Choice(state,Agenda.of(tasks),PlanSteps.of(plan),depth,CallingStack.of(calling_stack),None,cost)
+    # stack[:settled] have no alternatives left, and committed is the length of the plan last passed to commit
+    (settled,committed) = (0,0)
+    while True:
+        if node is not None:
+            # Enter node, like the top of seek_plan
+            if commit is not None:
+                while settled < len(stack) and _settled(stack[settled],methods):
+                    settled += 1
+                if settled == len(stack) and len(node.plan) > committed:
+                    committed = len(node.plan)
+                    commit(node.plan)
+            while pause is not None and pause():
+                yield PAUSED
+            (state,tasks,depth) = (node.state,node.tasks,node.depth)
+            if stats is not None:
+                stats.enter(tasks,node.calling_stack)
+            if prune is not None and prune(state,tasks,node.cost,node.calling_stack):
+                if undo and node.mark is not None:
+                    state.rollback(node.mark)
+                node = None
+                continue
+            if verbose>1: print('depth {} tasks {}'.format(depth,tasks))
+            if tasks == []:
+                if verbose>2: print('depth {} returns plan {}'.format(depth,node.plan))
+                yield _solved(stack,node.plan.tolist(),memo)
+                if undo and node.mark is not None:
+                    state.rollback(node.mark)
+                node = None
+                continue
+            stack.append(node)
+            if memo is not None:
+                node.key = memo.key(state,tasks,node.calling_stack)
+                if memo.subplans is not None:
+                    node.subkey = memo.subplan_key(state,tasks[0])
+                known = memo.lookup(node.key)
+                if known is FAILED:
+                    if verbose>2: print('depth {} memo returns failure'.format(depth))
+                    _abandon(stack,undo,None,stats,nogoods)
+                    node = None
+                    continue
+                if known is not None:
+                    if verbose>2: print('depth {} memo returns plan {}'.format(depth,node.plan+known))
+                    yield _solved(stack,node.plan+known,memo)
+                    _abandon(stack,undo)
+                    node = None
+                    continue
+            if nogoods is not None:
+                node.nogood = nogoods.key(state,tasks,node.calling_stack)
+                if nogoods.fails(*node.nogood):
+                    if verbose>2: print('depth {} nogood returns failure'.format(depth))
+                    _abandon(stack,undo,memo,stats)
+                    node = None
+                    continue
+            task1 = tasks[0]
+            child = None
+            if task1[0] in operators:
+                if verbose>2: print('depth {} action {}'.format(depth,task1))
+                operator = operators[task1[0]]
+                if stats is not None:
+                    began = time.perf_counter()
+                if undo:
+                    mark = state.mark()
+                    newstate = operator(state,*task1[1:])
+                else:
+                    mark = None
+                    newstate = operator(copy.deepcopy(state),*task1[1:])
+                if stats is not None:
+                    stats.operator_seconds[task1[0]] += time.perf_counter()-began
+                    stats.operator_calls[task1[0]] += 1
+                    if not newstate:
+                        stats.operator_failures[task1[0]] += 1
+                if verbose>2:
+                    print('depth {} new state:'.format(depth))
+                    print_state(newstate)
+                if newstate:
+                    cost = node.cost + action_cost(task1) if action_cost is not None else 0
+                    child = _Choice(newstate,tasks.after([]),node.plan.extend(task1),depth+1,node.calling_stack,mark,cost)
+                elif undo:
+                    state.rollback(mark)
+            node = child
+            continue
+
+        # Resume the innermost choice point that still has alternatives
+        if stack == []:
+            return
+        top = stack[-1]
+        (state,tasks,depth) = (top.state,top.tasks,top.depth)
+        task1 = tasks[0]
+        if top.alternatives is None:
+            pruned = False
+            for check in checks:
+                if check(state, task1, tasks, top.plan, depth, top.calling_stack):
+                    pruned = True
+                    if stats is not None:
+                        stats.check_fires[check.__name__] += 1
+                    break
+            if pruned or task1[0] not in methods:
+                if not pruned and verbose>2: print('depth {} returns failure'.format(depth))
+                _abandon(stack,undo,memo,stats,nogoods)
+                continue
+            if verbose>2: print('depth {} method instance {}'.format(depth,task1))
+            top.alternatives = iter(methods[task1[0]])
+        for method in top.alternatives:
+            subtasks = method(state,*task1[1:])
+            if stats is not None:
+                stats.method_attempts[method.__name__] += 1
+                if subtasks != False:
+                    stats.method_successes[method.__name__] += 1
+            # Can't just say "if subtasks:", because that's wrong if subtasks == []
+            if verbose>2:
+                print('depth {} new tasks: {}'.format(depth,subtasks))
+            if subtasks != False:
+                node = _Choice(state,tasks.after(subtasks),top.plan,depth+1,top.calling_stack.push(task1),None,top.cost)
+                break
+        else:
+            if verbose>2: print('depth {} returns failure'.format(depth))
+            _abandon(stack,undo,memo,stats,nogoods)
+
+def frontier(state,tasks,levels=1,domain=None):
+    """
+    Split the search for tasks into independent subproblems. Starting from
+    state, apply operators and try methods as seek_plan does, until the
+    search has branched at levels nodes where more than one operator or
+    method applies. Return the subproblems it reached, as a list of
+    (state,tasks,plan,depth,calling_stack), in the order seek_plan would
+    search them: the plan pyhop returns is the first plan that
+    iter_plans(state,tasks,start=(plan,depth,calling_stack)) finds for any
+    of them, taken in order. A subproblem with no tasks is already solved.
+    """
+    if domain is None:
+        domain = default_domain
+    (operators,methods,checks) = (domain.operators,domain.methods,domain.checks)
+    subproblems = []
+    pending = [(state,Agenda.of(tasks),EMPTY_PLAN,0,CallingStack(),levels)]
+    while pending:
+        (state,tasks,plan,depth,calling_stack,left) = pending.pop()
+        if tasks == [] or left == 0:
+            subproblems.append((state,tasks.tolist(),plan.tolist(),depth,calling_stack.tolist()))
+            continue
+        task1 = tasks[0]
+        children = []
+        if task1[0] in operators:
+            newstate = operators[task1[0]](copy.deepcopy(state),*task1[1:])
+            if newstate:
+                children.append((newstate,tasks.after([]),plan.extend(task1),depth+1,calling_stack))
+        if task1[0] in methods and not any(check(state,task1,tasks,plan,depth,calling_stack) for check in checks):
+            for method in methods[task1[0]]:
+                subtasks = method(state,*task1[1:])
+                if subtasks != False:
+                    children.append((state,tasks.after(subtasks),plan,depth+1,calling_stack.push(task1)))
+        if len(children) > 1:
+            left -= 1
+        pending.extend(child+(left,) for child in reversed(children))
+    return subproblems
+
+def stream_plan(state,tasks,verbose=0,domain=None,stats=None):
+    """
+    Generate the steps of the plan pyhop(state,tasks) returns, in order,
+    while the search is still running. A step is generated as soon as every
+    choice point that could backtrack over it has run out of alternatives,
+    so the steps generated are always the start of the plan, unless there
+    is no plan at all. The generator returns (as StopIteration.value) the
+    whole plan, or False if there is none. domain and stats are as in pyhop.
+    """
+    latest = [EMPTY_PLAN]
+    def commit(plan):
+        latest[0] = plan
+    sent = 0
+    mark = state.mark() if isinstance(state,UndoState) else None
+    plans = iter_plans(state,tasks,verbose,None,None,None,domain,lambda: len(latest[0]) > sent,stats,None,commit)
+    try:
+        for plan in plans:
+            if plan is PAUSED:
+                for step in latest[0].since(sent):
+                    yield step
+                sent = len(latest[0])
+                continue
+            for step in plan[sent:]:
+                yield step
+            return plan
+        return False
+    finally:
+        plans.close()
+        if mark is not None:
+            state.rollback(mark)
+
+def _settled(node,methods):
+    # Whether backtracking to node can only fail: no methods left to try, and none at all after its operator
+    if node.alternatives is None:
+        return node.tasks[0][0] not in methods
+    return length_hint(node.alternatives) == 0
+
+def _abandon(stack,undo,memo=None,stats=None,nogoods=None):
+    node = stack.pop()
+    if stats is not None:
+        stats.backtracks[node.tasks[0][0]] += 1
+    if memo is not None and node.key is not None and not node.solved:
+        memo.record(node.key,FAILED)
+    if nogoods is not None and node.nogood is not None and not node.solved:
+        nogoods.record(*node.nogood)
+    if undo and node.mark is not None:
+        node.state.rollback(node.mark)
+
+def _solved(stack,plan,memo):
+    # Every node on the stack has a plan below it, so none of them may be recorded as failing when abandoned later
+    for node in stack:
+        node.solved = True
+    if memo is not None and memo.solutions:
+        for node in stack:
+            if node.key is not None:
+                memo.record(node.key,plan[len(node.plan):])
+    if memo is not None and memo.subplans is not None:
+        # A node's first task is done at the first node after it with one task fewer: tasks only shrink one at a time
+        ends = {0:len(plan)}
+        for node in reversed(stack):
+            end = ends.get(len(node.tasks)-1)
+            if node.subkey is not None and end is not None:
+                memo.record_subplan(node.subkey,plan[len(node.plan):end])
+            ends[len(node.tasks)] = len(node.plan)
+    return plan
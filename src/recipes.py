@@ -0,0 +1,168 @@
+"""
+One-time compile step over the Recipes in crafting.json.
+
+RecipeGraph(data) builds the producer/consumer graph of the recipes, sorts
+the items into crafting tiers, and tabulates the cheapest time per unit of
+every item for every set of tools that could be owned. autoHTN reads its
+method ordering, consume order and time bounds from these tables instead
+of working them out at every node.
+"""
+
+import itertools
+
+
+def op_name(recipe_name):
+    return 'op_' + str(recipe_name).replace(" ", "_")
+
+
+class RecipeGraph(object):
+    """
+    - producers[item]: names of the recipes that produce item, fastest first
+    - consumers[item]: names of the recipes that consume or require item
+    - tiers[item]: 1 for items made from nothing, otherwise one more than
+      the highest tier among the inputs of its earliest recipe
+    - order: every obtainable item, lowest tier first
+    - consume_order: the same, highest tier first; the order in which a
+      recipe's consumed items are gathered
+    - needs[item]: names of every recipe that making item can involve; see
+      also relevant(goal)
+    - step_time[item]: the least Time per unit of any recipe for item, not
+      counting its inputs
+    - most_produced[item]: the most units of item one recipe execution makes
+    - unit_values[tools]: for each frozenset of tools, the cheapest time
+      per unit of every item using only recipes those tools allow
+    """
+
+    def __init__(self, data):
+        self.recipes = data['Recipes']
+        self.tools = list(data['Tools'])
+        self.items = list(data['Items']) + [tool for tool in self.tools if tool not in data['Items']]
+
+        self.producers = {}
+        self.consumers = {}
+        self.step_time = {}
+        self.most_produced = {}
+        for name, rule in sorted(self.recipes.items(), key=lambda recipe: recipe[1]['Time']):
+            for item, num in rule['Produces'].items():
+                self.producers.setdefault(item, []).append(name)
+                self.step_time[item] = min(self.step_time.get(item, float('inf')), rule['Time'] / float(num))
+                self.most_produced[item] = max(self.most_produced.get(item, 0), num)
+            for item in itertools.chain(rule.get('Requires', {}), rule.get('Consumes', {})):
+                self.consumers.setdefault(item, []).append(name)
+        self.consumed = set(item for rule in self.recipes.values() for item in rule.get('Consumes', {}))
+
+        self.tiers = self._tiers()
+        self.order = sorted(self.tiers, key=lambda item: (self.tiers[item], item))
+        self.consume_order = sorted(self.tiers, key=lambda item: (-self.tiers[item], item))
+        self.needs = {item: self._needs(item) for item in self.items}
+
+        self.unit_values = {}
+        for size in range(len(self.tools) + 1):
+            for owned in itertools.combinations(self.tools, size):
+                self.unit_values[frozenset(owned)] = self._unit_values(set(owned))
+
+    @staticmethod
+    def inputs(rule):
+        return list(itertools.chain(rule.get('Requires', {}), rule.get('Consumes', {})))
+
+    def _tiers(self):
+        tiers = {}
+        changed = True
+        while changed:
+            changed = False
+            for rule in self.recipes.values():
+                if all(item in tiers for item in self.inputs(rule)):
+                    tier = 1 + max([tiers[item] for item in self.inputs(rule)] or [0])
+                    for item in rule['Produces']:
+                        if tier < tiers.get(item, float('inf')):
+                            tiers[item] = tier
+                            changed = True
+        return tiers
+
+    def _needs(self, item):
+        needed = set()
+        pending = [item]
+        while pending:
+            for name in self.producers.get(pending.pop(), []):
+                if name not in needed:
+                    needed.add(name)
+                    pending.extend(self.inputs(self.recipes[name]))
+        return frozenset(needed)
+
+    def _unit_values(self, owned):
+        # Any recipe execution raises sum(value * count) over the inventory by at most its Time
+        usable = [rule for rule in self.recipes.values() if set(rule.get('Requires', {})) <= owned]
+
+        values = {item: float('inf') for item in self.items}
+        changed = True
+        while changed:
+            changed = False
+            for rule in usable:
+                cost = rule['Time'] + sum(values[item] * num for item, num in rule.get('Consumes', {}).items())
+                for item, num in rule['Produces'].items():
+                    if cost / float(num) < values[item]:
+                        values[item] = cost / float(num)
+                        changed = True
+
+        return values
+
+    def relevant(self, goal, initial=None, time=None):
+        """
+        The names of every recipe that making the items in goal can involve,
+        and every item (goal items included) that one of them reads or writes.
+        Given the initial inventory and the time budget, recipes that need or
+        make a tool that can't be afforded are left out as well; see
+        _unaffordable.
+        """
+        excluded = set()
+        while True:
+            recipes = set()
+            pending = list(goal)
+            while pending:
+                for name in self.producers.get(pending.pop(), []):
+                    rule = self.recipes[name]
+                    if name not in recipes and excluded.isdisjoint(self.inputs(rule) + list(rule['Produces'])):
+                        recipes.add(name)
+                        pending.extend(self.inputs(rule))
+            if time is None:
+                break
+            unaffordable = self._unaffordable(goal, initial or {}, time, excluded)
+            if not unaffordable:
+                break
+            excluded.update(unaffordable)
+
+        items = set(goal)
+        for name in recipes:
+            items.update(self.recipes[name]['Produces'])
+            items.update(self.inputs(self.recipes[name]))
+        return recipes, items
+
+    def _unaffordable(self, goal, initial, time, excluded):
+        # Tools outside excluded that no plan from initial within time can make. A plan that makes the set of tools
+        # made, and so only uses recipes that owned + made allow, raises the sum of unit_values[owned + made] * count
+        # over the inventory by at most the time it takes. It ends up holding the goal and every tool in made that
+        # nothing consumes, so any tool that is in no affordable made is unaffordable. Nothing is, if an item is held
+        # that can't be made with those tools, since then there is no bound
+        owned = set(tool for tool in self.tools if initial.get(tool, 0) > 0)
+        candidates = [tool for tool in self.tools if tool not in owned and tool not in excluded]
+        affordable = set()
+        for size in range(len(candidates) + 1):
+            for made in itertools.combinations(candidates, size):
+                if affordable.issuperset(made):
+                    continue
+                values = self.unit_values[frozenset(owned.union(made))]
+                held = [values.get(item, float('inf')) * num for item, num in initial.items()
+                        if num > 0 and (item not in owned or item in self.consumed)]
+                if float('inf') in held:
+                    return set()
+                cost = sum(values[tool] for tool in made if tool not in self.consumed)
+                cost += sum(values.get(item, float('inf')) * num for item, num in goal.items()
+                            if item not in owned or item in self.consumed)
+                if cost - sum(held) <= time:
+                    affordable.update(made)
+
+        return set(candidates) - affordable - set(goal)
+
+    def unit_time(self, item, owned=()):
+        """Cheapest time for one unit of item with the tools in owned, ignoring what those tools cost."""
+        return self.unit_values[frozenset(owned)][item]
@@ -0,0 +1,144 @@
+"""
+Plan crafting problems for asyncio code without blocking its event loop.
+
+A PlanningService runs each search in a pool of worker processes, which load
+the compiled domain once as in batch, and awaits the result. Problems are the
+dicts of batch: 'Initial', 'Goal', 'time' and optionally 'ID'.
+
+    service = PlanningService(rules, workers=4)
+    try:
+        plan = await service.plan({'Goal': {'iron_pickaxe': 1}, 'time': 300}, deadline=0.5)
+    except asyncio.TimeoutError:
+        ...
+    await service.close()
+
+Identical requests (same Initial, Goal, time and ID) made while a search for
+one of them is running share that search instead of starting their own, as
+long as the search may run at least until the new request's deadline. A
+request with a later deadline (or none) starts a new search, which later
+identical requests join instead.
+
+With workers=None the searches run in one thread of this process instead,
+which is enough for tests but holds the event loop up whenever the search
+holds the GIL.
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import time
+
+import batch
+import plan_cache
+
+
+def request_key(problem):
+    """The key under which identical problems share a search."""
+    return (plan_cache.canonical(problem.get('Initial', {}), problem['Goal']), problem.get('time', 0),
+            problem.get('ID', 'agent'))
+
+
+def _solve(problem, deadline):
+    # Runs in a worker: the plan for problem, False if there is none, or None if time.time() passed deadline first
+    domain, state, goals = batch.set_up(problem)
+    search = domain.anytime(state, goals)
+    search.run(seconds=max(deadline - time.time(), 0) if deadline is not None else None)
+    if not search.done():
+        search.close()
+        return None
+    return search.plan
+
+
+class _Search(object):
+    # A search in the pool, the time.time() at which its worker gives up (None for never) and the number of requests
+    # still waiting for it
+    def __init__(self, future, until):
+        self.future = future
+        self.until = until
+        self.waiting = 0
+
+    def lasts_until(self, until):
+        return self.until is None or (until is not None and self.until >= until)
+
+
+class PlanningService(object):
+    """
+    Plans for the recipes in rules (the parsed crafting.json, read from the
+    current directory if not given), searched in a pool of workers
+    processes, or in one thread of this process with workers=None.
+    """
+
+    def __init__(self, rules=None, workers=None):
+        if rules is None:
+            with open('crafting.json') as f:
+                rules = json.load(f)
+        rules = {key: rules[key] for key in ('Items', 'Tools', 'Recipes')}
+        if workers is None:
+            self._pool = concurrent.futures.ThreadPoolExecutor(1, initializer=batch._load_domain, initargs=(rules,))
+        else:
+            self._pool = concurrent.futures.ProcessPoolExecutor(workers, initializer=batch._load_domain,
+                                                                initargs=(rules,))
+        self._searches = {}
+        self.searches = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    async def plan(self, problem, deadline=None):
+        """
+        The plan for problem, or False if there is none. If deadline (in
+        seconds from now) passes before the plan is known, raises
+        asyncio.TimeoutError; the search stops then too, unless other
+        requests are still waiting for it.
+        """
+        key = request_key(problem)
+        until = time.time() + deadline if deadline is not None else None
+        search = self._searches.get(key)
+        if search is None or not search.lasts_until(until):
+            search = self._start(key, problem, until)
+        else:
+            self.coalesced += 1
+
+        search.waiting += 1
+        try:
+            plan = await asyncio.wait_for(asyncio.shield(search.future), deadline)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            search.waiting -= 1
+            if search.waiting == 0 and not search.future.done():
+                # Nobody wants it any more: drop it from the queue, or let the worker give up at its deadline
+                search.future.cancel()
+                self._forget(key, search)
+        if plan is None:
+            self.timeouts += 1
+            raise asyncio.TimeoutError
+        return list(plan) if plan else False
+
+    def _start(self, key, problem, until):
+        search = _Search(asyncio.wrap_future(self._pool.submit(_solve, problem, until)), until)
+        self._searches[key] = search
+        self.searches += 1
+        search.future.add_done_callback(lambda future: self._forget(key, search))
+        return search
+
+    def _forget(self, key, search):
+        # Later requests for key start a new search, rather than join this one
+        if self._searches.get(key) is search:
+            del self._searches[key]
+
+    def stats(self):
+        return {'searches': self.searches, 'coalesced': self.coalesced, 'timeouts': self.timeouts,
+                'running': len(self._searches)}
+
+    async def close(self):
+        """Cancel the searches not started yet and wait for the workers to finish the others."""
+        for search in list(self._searches.values()):
+            search.future.cancel()
+        await asyncio.get_running_loop().run_in_executor(None, self._pool.shutdown)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
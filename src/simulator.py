@@ -0,0 +1,129 @@
+"""
+Replay crafting plans against the recipes in crafting.json.
+
+A Simulator compiles every recipe once, with codegen.compile_operator, into
+an operator over a CompactState, so replaying a step is one call that checks
+the whole precondition and applies the whole recipe to the inventory row at
+once. Replaying a plan checks every step and then the goal:
+
+    simulator = Simulator(data)
+    result = simulator.replay(plan, time=300)
+    if not result['valid']:
+        print(result['step'], result['reason'])
+
+Plans are lists of (op, ID) steps, or (op, ID, count) steps from lifted
+planning. Replaying is independent of pyhop, so it can check the plans of
+any planner, thousands per second:
+
+    python simulator.py plans.json --time 300
+"""
+
+import argparse
+import copy
+import itertools
+import json
+import sys
+
+import autoHTN
+import codegen
+from inventory import item_index
+from recipes import op_name
+
+
+class Simulator(object):
+    """
+    The recipes of data compiled for replaying plans of the agents in
+    agents, which all start from data['Initial'] and must all end up holding
+    data['Goal'].
+    """
+
+    def __init__(self, data, agents=('agent',)):
+        self.index = item_index(data)
+        self.agents = list(agents)
+        self.initial = autoHTN.set_up_compact_state(data, self.agents, index=self.index)
+        self.rules = {op_name(name): rule for name, rule in data['Recipes'].items()}
+        self.operators = {name: codegen.compile_operator(recipe_name, rule, self.index)
+                          for recipe_name, rule in data['Recipes'].items() for name in [op_name(recipe_name)]}
+        self.goal = list(data['Goal'].items())
+
+    def replay(self, plan, time=0):
+        """
+        Replay plan with time for each agent. Returns a dict with
+        - valid: whether every step could be carried out and every agent
+          holds the goal at the end
+        - step: the position in plan of the step that failed, or None
+        - reason: why the plan isn't valid, or None
+        - inventory: {ID: {item: amount}} when the replay stopped
+        - times: the time the agent of each step had left after it
+        """
+        state = copy.deepcopy(self.initial)
+        for ID in self.agents:
+            state.time = {ID: time}
+        (values, rows, clock) = (state.values, state.rows, self.index['time'])
+        times = []
+
+        for step, task in enumerate(plan):
+            operator = self.operators.get(task[0])
+            if operator is None:
+                return self._result(state, times, step, 'there is no recipe for {}'.format(task[0]))
+            if task[1] not in rows:
+                return self._result(state, times, step, '{} is not one of the agents'.format(task[1]))
+            for repetition in range(task[2] if len(task) > 2 else 1):
+                if operator(state, task[1]) is False:
+                    return self._result(state, times, step, self._shortfall(state, task, repetition))
+            times.append(values[rows[task[1]] + clock])
+
+        for ID in self.agents:
+            for item, num in self.goal:
+                if getattr(state, item)[ID] < num:
+                    reason = '{} ends with {} {} but the goal is {}'.format(ID, getattr(state, item)[ID], item, num)
+                    return self._result(state, times, None, reason)
+        return self._result(state, times, None, None)
+
+    def replay_all(self, plans, time=0):
+        """replay for each plan in plans, in order."""
+        return [self.replay(plan, time) for plan in plans]
+
+    def _shortfall(self, state, task, repetition):
+        # What the step in task was missing when its operator failed, the same checks in the same order as the operator
+        rule = self.rules[task[0]]
+        ID = task[1]
+        for item, num in itertools.chain(rule.get('Requires', {}).items(), rule.get('Consumes', {}).items(),
+                                         [('time', rule['Time'])]):
+            have = getattr(state, item)[ID]
+            if have < num:
+                reason = '{} needs {} {} but {} has {}'.format(task[0], num, item, ID, have)
+                if len(task) > 2:
+                    reason += ' (run {} of {})'.format(repetition + 1, task[2])
+                return reason
+
+    def _result(self, state, times, step, reason):
+        values = state.values
+        inventory = {ID: {name: values[state.rows[ID] + slot] for name, slot in self.index.items()} for ID in self.agents}
+        return {'valid': reason is None, 'step': step, 'reason': reason, 'inventory': inventory, 'times': times}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check a JSON list of plans against the recipes in crafting.json.')
+    parser.add_argument('plans', help='JSON file holding a list of plans, each a list of [op, ID] or [op, ID, count]')
+    parser.add_argument('--rules', default='crafting.json', help='crafting.json to check against')
+    parser.add_argument('--time', type=int, default=300, help='time each agent starts with')
+    args = parser.parse_args(argv)
+
+    with open(args.rules) as f:
+        data = json.load(f)
+    with open(args.plans) as f:
+        plans = json.load(f)
+
+    agents = sorted(set(task[1] for plan in plans for task in plan)) or ['agent']
+    results = Simulator(data, agents).replay_all(plans, args.time)
+    for number, result in enumerate(results):
+        if result['valid']:
+            print('plan {}: valid, {} time left'.format(number, min(row['time'] for row in result['inventory'].values())))
+        else:
+            print('plan {}: invalid at step {}: {}'.format(number, result['step'], result['reason']))
+    return 0 if all(result['valid'] for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,283 @@
+import copy
+import itertools
+import json
+import os
+import pickle
+
+import pytest
+
+import autoHTN
+import codegen
+import pyhop
+from inventory import CompactState, item_index
+
+with open(os.path.join(os.path.dirname(__file__), 'crafting.json')) as f:
+    DATA = json.load(f)
+
+INDEX = item_index(DATA)
+NAMES = [name for name in INDEX if name != 'time']
+
+
+def inventories():
+    # Empty, just enough for some recipes, and plenty of everything, with a few time budgets
+    for num, time in itertools.product((0, 1, 2, 3, 8), (0, 1, 4, 100)):
+        yield {name: num for name in NAMES}, time
+
+
+def both_states(inventory, time):
+    state = pyhop.State('state')
+    compact = CompactState('state', INDEX, ['agent'])
+    state.time = {'agent': time}
+    compact.time = {'agent': time}
+    for name, num in inventory.items():
+        setattr(state, name, {'agent': num})
+        setattr(compact, name, {'agent': num})
+    return state, compact
+
+
+@pytest.mark.parametrize('name', sorted(DATA['Recipes']))
+def test_compact_operator_matches_make_operator(name):
+    rule = DATA['Recipes'][name]
+    operator = autoHTN.make_operator(rule)
+    compact_operator = autoHTN.make_compact_operator(rule, INDEX)
+    for inventory, time in inventories():
+        state, compact = both_states(inventory, time)
+        result = operator(state, 'agent')
+        compact_result = compact_operator(compact, 'agent')
+        assert (result is False) == (compact_result is False)
+        for name in INDEX:
+            assert getattr(state, name)['agent'] == getattr(compact, name)['agent']
+
+
+@pytest.mark.parametrize('name', sorted(DATA['Recipes']))
+def test_compiled_operators_match_make_operator(name):
+    rule = DATA['Recipes'][name]
+    operator = autoHTN.make_operator(rule)
+    compiled = codegen.compile_operator(name, rule)
+    compiled_compact = codegen.compile_operator(name, rule, INDEX)
+    assert compiled.__name__ == compiled_compact.__name__ == autoHTN.op_name(name)
+    for inventory, time in inventories():
+        state, compact = both_states(inventory, time)
+        new = copy.deepcopy(state)
+        result = operator(state, 'agent')
+        assert (result is False) == (compiled(new, 'agent') is False) == (compiled_compact(compact, 'agent') is False)
+        for name in INDEX:
+            assert getattr(state, name)['agent'] == getattr(new, name)['agent'] == getattr(compact, name)['agent']
+
+
+def test_compiled_methods_match_make_method():
+    graph = autoHTN.RecipeGraph(DATA)
+    for name, rule in DATA['Recipes'].items():
+        method = autoHTN.make_method(name, rule, graph.consume_order)
+        compiled = codegen.compile_method(name, rule, graph.consume_order)
+        assert (compiled.__name__, compiled.produces, compiled.time) == (method.__name__, method.produces, method.time)
+        for ID in ('agent', 'other', 'agent'):
+            tasks = compiled(None, ID)
+            assert tasks == method(None, ID)
+            tasks.append('junk')
+            assert compiled(None, ID) == method(None, ID)
+
+
+def test_compact_operator_folds_overlaps_and_drops_zero_deltas():
+    rule = {'Produces': {'plank': 2}, 'Requires': {'plank': 3, 'bench': 1}, 'Consumes': {'plank': 2}, 'Time': 1}
+    operator = autoHTN.make_compact_operator(rule, INDEX)
+    state, compact = both_states({'plank': 2, 'bench': 1}, 5)
+    assert operator(compact, 'agent') is False
+    compact.plank = {'agent': 3}
+    assert operator(compact, 'agent') is compact
+    assert compact.plank['agent'] == 3 and compact.time['agent'] == 4
+
+
+def test_compact_state_copy_equality_and_hash():
+    state = autoHTN.set_up_compact_state(DATA, ['a', 'b'], time=10)
+    state.wood = {'b': 3}
+    new = copy.deepcopy(state)
+    assert new == state and hash(new) == hash(state)
+    assert new.values is not state.values and new.rows is state.rows
+    new.wood['a'] = 1
+    assert new != state and state.wood['a'] == 0
+    assert pickle.loads(pickle.dumps(state)) == state
+
+
+def test_compact_plans_match():
+    data = copy.deepcopy(DATA)
+    data['Goal'] = {'iron_pickaxe': 1}
+    goals = autoHTN.set_up_goals(data, 'agent')
+    del pyhop.checks[:]
+    autoHTN.add_heuristic(data, 'agent')
+    autoHTN.declare_operators(data)
+    autoHTN.declare_methods(data)
+    expected = pyhop.pyhop(autoHTN.set_up_state(data, 'agent', time=300), goals)
+    autoHTN.declare_operators(data, INDEX)
+    autoHTN.declare_methods(data, compact=True)
+    assert pyhop.pyhop(autoHTN.set_up_compact_state(data, ['agent'], time=300), goals) == expected
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_compiled_domain_plans_match(compact):
+    data = copy.deepcopy(DATA)
+    data['Goal'] = {'cart': 1, 'rail': 20}
+    goals = autoHTN.set_up_goals(data, 'agent')
+    if compact:
+        state = autoHTN.set_up_compact_state(data, ['agent'], time=300)
+    else:
+        state = autoHTN.set_up_state(data, 'agent', time=300, undo=True)
+    expected = autoHTN.make_domain(data, 'agent', compact).pyhop(state, goals)
+    assert expected
+    assert autoHTN.make_domain(data, 'agent', compact, compiled=True).pyhop(state, goals) == expected
+
+
+@pytest.mark.parametrize('goal, time', [({'stick': 1}, 10), ({'wooden_pickaxe': 1}, 20), ({'furnace': 1}, 60),
+                                        ({'iron_pickaxe': 1}, 90), ({'rail': 10}, 300)])
+def test_relevant_data_finds_the_same_plan(goal, time):
+    data = dict(DATA, Goal=goal, Initial={'plank': 1})
+    reduced = autoHTN.relevant_data(data, time)
+    assert set(reduced['Recipes']) < set(data['Recipes']) and set(reduced['Items']) < set(data['Items'])
+
+    plans = []
+    for data in (data, reduced):
+        state = autoHTN.set_up_compact_state(data, ['agent'], time=time)
+        plans.append(autoHTN.make_domain(data, 'agent', compact=True).pyhop(state, autoHTN.set_up_goals(data, 'agent')))
+    assert plans[0] and plans[0] == plans[1]
+
+
+def replay(data, plan, time):
+    # Runs plan through make_operator on a plain state; returns the final state, or False if a step fails
+    state = autoHTN.set_up_state(data, 'agent', time=time)
+    operators = {'op_' + name.replace(' ', '_'): autoHTN.make_operator(rule) for name, rule in data['Recipes'].items()}
+    for task in plan:
+        state = operators[task[0]](state, *task[1:])
+        if state is False:
+            return False
+    return state
+
+
+@pytest.mark.parametrize('goal, cost', [({'wooden_pickaxe': 1}, 18), ({'furnace': 1}, 48), ({'wood': 12}, 42)])
+def test_optimal_plan(goal, cost):
+    data = copy.deepcopy(DATA)
+    data['Goal'] = goal
+    del pyhop.checks[:]
+    autoHTN.add_heuristic(data, 'agent')
+    autoHTN.declare_operators(data, INDEX)
+    autoHTN.declare_methods(data, compact=True)
+    state = autoHTN.set_up_compact_state(data, ['agent'], time=300)
+    goals = autoHTN.set_up_goals(data, 'agent')
+    action_time = autoHTN.make_action_time(data)
+    time_bound = autoHTN.make_time_bound(data, 'agent')
+
+    first = pyhop.pyhop(state, goals)
+    plan, found_cost, nodes = pyhop.pyhop_optimal(state, goals, action_time, time_bound)
+    assert found_cost == cost == sum(map(action_time, plan)) <= sum(map(action_time, first))
+    assert nodes > 0
+    assert time_bound(state, goals) <= cost
+
+    final = replay(data, plan, 300)
+    assert final and 300 - final.time['agent'] == cost
+    assert all(getattr(final, item)['agent'] >= num for item, num in goal.items())
+
+
+@pytest.mark.parametrize('goal, time', [({'furnace': 1}, 300), ({'cart': 1, 'rail': 20}, 300), ({'wood': 200}, 2000)])
+def test_lifted_plans_are_shallower(goal, time):
+    data = dict(DATA, Goal=goal)
+    goals = autoHTN.set_up_goals(data, 'agent')
+    state = autoHTN.set_up_compact_state(data, ['agent'], time=time)
+    action_time = autoHTN.make_action_time(data)
+
+    depths = []
+    for lifted in (False, True):
+        stats = pyhop.SearchStats(stacks=True)
+        plan = autoHTN.make_domain(data, 'agent', compact=True, lifted=lifted).pyhop(state, goals, stats=stats)
+        depths.append(max(len(names) for names in stats.stacks))
+    assert depths[1] < depths[0]
+    assert any(len(task) == 3 and task[2] > 1 for task in plan)
+
+    final = replay(data, autoHTN.expand_plan(plan), time)
+    assert final and time - final.time['agent'] == sum(map(action_time, plan))
+    assert all(getattr(final, item)['agent'] >= num for item, num in goal.items())
+    assert autoHTN.make_time_bound(data, 'agent')(state, goals) <= sum(map(action_time, plan))
+
+
+def test_repeated_operator_runs_count_times():
+    rule = DATA['Recipes']['craft plank']
+    operator = autoHTN.make_repeated_operator(autoHTN.make_compact_operator(rule, INDEX))
+    state, compact = both_states({'wood': 3}, 10)
+    assert operator(compact, 'agent', 3) is compact
+    assert (compact.wood['agent'], compact.plank['agent']) == (0, 12)
+    assert operator(compact, 'agent', 1) is False
+    assert autoHTN.expand_plan([('op_craft_plank', 'agent', 2), ('op_craft_stick', 'agent')]) == \
+        [('op_craft_plank', 'agent'), ('op_craft_plank', 'agent'), ('op_craft_stick', 'agent')]
+    assert autoHTN.make_action_time(DATA)(('op_craft_plank', 'agent', 2)) == 2 * rule['Time']
+
+
+
+@pytest.mark.parametrize('goal, time', [({'furnace': 1}, 300), ({'iron_pickaxe': 1}, 90), ({'cart': 1, 'rail': 10}, 600),
+                                        ({'wooden_pickaxe': 1}, 15)])
+@pytest.mark.parametrize('lifted', [False, True])
+def test_time_check_keeps_plans(goal, time, lifted):
+    data = dict(DATA, Goal=goal)
+    goals = autoHTN.set_up_goals(data, 'agent')
+    state = autoHTN.set_up_compact_state(data, ['agent'], time=time)
+    expected = autoHTN.make_domain(data, 'agent', compact=True, lifted=lifted).pyhop(state, goals)
+    domain = autoHTN.make_domain(data, 'agent', compact=True, lifted=lifted, time_check=True)
+    assert domain.pyhop(state, goals) == expected
+    check = domain.checks[-1]
+    assert isinstance(check, autoHTN.TimeCheck) and (check.reason() is None) == (check.pruned == 0)
+
+
+def test_time_check_fails_fast_and_says_why():
+    data = dict(DATA, Goal={'furnace': 1})
+    goals = autoHTN.set_up_goals(data, 'agent')
+    state = autoHTN.set_up_compact_state(data, ['agent'], time=25)
+    domain = autoHTN.make_domain(data, 'agent', compact=True)
+    check = autoHTN.add_time_check(data, 'agent', domain=domain)
+    stats = pyhop.SearchStats()
+    assert domain.pyhop(state, goals, stats=stats) is False
+    assert stats.nodes == 1 and stats.check_fires['time_check'] == 1
+    assert check.reason() == 'the goal needs at least 31.75 time but only 25 is available'
+
+    check.reset()
+    assert check.reason() is None
+    state = autoHTN.set_up_compact_state(data, ['agent'], time=15)
+    assert autoHTN.make_domain(data, 'agent', compact=True, time_check=True).pyhop(state, goals) is False
+
+
+@pytest.mark.parametrize('goal, times', [({'iron_pickaxe': 1}, (40, 90, 50)), ({'furnace': 1}, (300, 25, 60)),
+                                         ({'cart': 1, 'rail': 10}, (600, 300)), ({'wooden_pickaxe': 1}, (15, 5, 12))])
+@pytest.mark.parametrize('lifted', [False, True])
+def test_nogoods_keep_plans_across_calls(goal, times, lifted):
+    data = dict(DATA, Goal=goal)
+    goals = autoHTN.set_up_goals(data, 'agent')
+    domain = autoHTN.make_domain(data, 'agent', compact=True, lifted=lifted, time_check=True, nogoods=True)
+    for time in times:
+        state = autoHTN.set_up_compact_state(data, ['agent'], time=time)
+        expected = autoHTN.make_domain(data, 'agent', compact=True, lifted=lifted, time_check=True).pyhop(state, goals)
+        assert domain.pyhop(state, goals) == expected
+    assert isinstance(domain.nogoods, autoHTN.TimeNogoods) and domain.nogoods.table
+
+
+def test_nogoods_skip_dead_ends_of_this_and_earlier_searches():
+    data = dict(DATA, Goal={'iron_pickaxe': 1})
+    goals = autoHTN.set_up_goals(data, 'agent')
+    domain = autoHTN.make_domain(data, 'agent', compact=True, lifted=True, time_check=True, nogoods=True)
+    stats = pyhop.SearchStats()
+    assert domain.pyhop(autoHTN.set_up_compact_state(data, ['agent'], time=60), goals, stats=stats) is False
+    # Without nogoods this search enters over 100000 nodes
+    assert stats.nodes < 2000 and domain.nogoods.hits > 0
+
+    # The root failed with 60 time, so it fails at once with less
+    stats = pyhop.SearchStats()
+    assert domain.pyhop(autoHTN.set_up_compact_state(data, ['agent'], time=55), goals, stats=stats) is False
+    assert stats.nodes == 1
+    key = domain.nogoods.key(autoHTN.set_up_compact_state(data, ['agent'], time=55), goals, pyhop.CallingStack())
+    assert domain.nogoods.table[key[0]] == 60 and key[1] == 55
+
+
+@pytest.mark.parametrize('goal', [{'wood': 1}, {'plank': 1}])
+def test_nogoods_keep_plans_after_enumerating_them(goal):
+    data = dict(DATA, Initial={}, Goal=goal)
+    goals = autoHTN.set_up_goals(data, 'agent')
+    domain = autoHTN.make_domain(data, 'agent', compact=True, nogoods=True)
+    state = autoHTN.set_up_compact_state(data, ['agent'], time=20)
+    plans = list(domain.iter_plans(state, goals))
+    # Nodes above the plans enumerated are abandoned afterwards, but they aren't dead ends
+    assert plans and domain.pyhop(state, goals) == plans[0]
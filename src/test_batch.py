@@ -0,0 +1,35 @@
+import json
+import os
+
+import batch
+import pyhop
+
+with open(os.path.join(os.path.dirname(__file__), 'crafting.json')) as f:
+    DATA = json.load(f)
+
+PROBLEMS = [
+    {'Goal': {'wooden_pickaxe': 1}, 'time': 300},
+    {'Goal': {'cart': 1, 'rail': 20}, 'time': 300},
+    {'Goal': {'wooden_pickaxe': 1}, 'time': 5},
+    {'Goal': {'furnace': 1}, 'Initial': {'cobble': 8, 'bench': 1}, 'time': 5, 'ID': 'miner'},
+]
+
+
+def test_plan_batch_in_process_leaves_default_domain_alone():
+    pyhop.add_check(len)
+    checks, methods = list(pyhop.checks), dict(pyhop.methods)
+    try:
+        results = dict(batch.plan_batch(PROBLEMS, rules=DATA))
+        assert pyhop.checks == checks and pyhop.methods == methods
+    finally:
+        pyhop.checks.remove(len)
+
+    assert sorted(results) == [0, 1, 2, 3]
+    assert results[0][-1] == ('op_craft_wooden_pickaxe_at_bench', 'agent')
+    assert results[1] and results[2] is False
+    assert results[3] == [('op_craft_furnace_at_bench', 'miner')]
+
+
+def test_plan_batch_workers_match_in_process():
+    problems = PROBLEMS * 3
+    assert dict(batch.plan_batch(problems, workers=2, rules=DATA)) == dict(batch.plan_batch(problems, rules=DATA))
@@ -0,0 +1,46 @@
+import json
+import os
+
+import benchmark
+
+with open(os.path.join(os.path.dirname(__file__), 'crafting.json')) as f:
+    DATA = json.load(f)
+
+
+def test_generate_problems_is_reproducible():
+    problems = benchmark.generate_problems(DATA, seed=3)
+    assert problems == benchmark.generate_problems(DATA, seed=3)
+    assert problems != benchmark.generate_problems(DATA, seed=4)
+    assert len(problems) == len(benchmark.SUITE_GOALS) * len(benchmark.SUITE_SIZES)
+    assert len(set(problem['name'] for problem in problems)) == len(problems)
+    largest = problems[-1]
+    assert largest['Goal'] == {'cart': benchmark.SUITE_SIZES[-1], 'rail': 10 * benchmark.SUITE_SIZES[-1]}
+
+
+def test_run_suite_records_every_metric():
+    problems = benchmark.generate_problems(DATA, sizes=(1,), goals=[{'wooden_pickaxe': 1}, {'iron_pickaxe': 1}])
+    results = benchmark.run_suite(DATA, problems, repeat=1)
+    assert [row['name'] for row in results] == [problem['name'] for problem in problems]
+    for row in results:
+        assert row['status'] == 'SOLVED' and row['nodes'] > 0 and row['seconds'] > 0
+        assert row['peak_bytes'] > 0 and row['cost'] > 0 and row['plan_length'] > 0 and row['valid'] is True
+
+    exhausted = benchmark.run_suite(DATA, problems[1:], repeat=1, max_nodes=10)[0]
+    assert exhausted['status'] == 'BUDGET_EXHAUSTED' and exhausted['cost'] is None and exhausted['valid'] is None
+
+
+def test_find_regressions():
+    baseline = [{'name': 'a', 'status': 'SOLVED', 'seconds': 0.010, 'peak_bytes': 10000, 'nodes': 50, 'cost': 20},
+                {'name': 'b', 'status': 'SOLVED', 'seconds': 0.00001, 'peak_bytes': 100, 'nodes': 5, 'cost': 2}]
+    same = [dict(row) for row in baseline]
+    same[1]['seconds'] = 0.0001
+    assert benchmark.find_regressions(same, baseline) == []
+
+    worse = [dict(row) for row in baseline]
+    worse[0]['nodes'] = 51
+    worse[1]['status'] = 'BUDGET_EXHAUSTED'
+    worse.append(dict(baseline[0], name='new', nodes=10 ** 6))
+    assert benchmark.find_regressions(worse, baseline) == ['a: nodes 50 -> 51', 'b: status SOLVED -> BUDGET_EXHAUSTED']
+
+    invalid = [dict(row, valid=False) for row in baseline[:1]]
+    assert benchmark.find_regressions(invalid, baseline) == ['a: the plan is not valid']
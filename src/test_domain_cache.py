@@ -0,0 +1,51 @@
+import json
+import os
+
+import autoHTN
+import codegen
+import domain_cache
+
+with open(os.path.join(os.path.dirname(__file__), 'crafting.json')) as f:
+    DATA = json.load(f)
+
+
+def test_load_builds_once_and_then_reads_the_cache(tmp_path, monkeypatch):
+    first = domain_cache.load(DATA, str(tmp_path))
+    assert os.listdir(str(tmp_path)) == [first.key + '.pickle']
+
+    def fail(data):
+        raise AssertionError('built again')
+    monkeypatch.setattr(domain_cache, 'build', fail)
+    second = domain_cache.load(dict(DATA, Goal={'rail': 3}), str(tmp_path))
+    assert second.key == first.key and second.index == first.index
+    assert vars(second.graph) == vars(first.graph) and set(second.code) == set(first.code)
+
+
+def test_changed_recipes_get_a_new_artifact(tmp_path):
+    first = domain_cache.load(DATA, str(tmp_path))
+    recipes = dict(DATA['Recipes'])
+    recipes['craft plank'] = dict(recipes['craft plank'], Time=2)
+    second = domain_cache.load(dict(DATA, Recipes=recipes), str(tmp_path))
+    assert second.key != first.key and len(os.listdir(str(tmp_path))) == 2
+    assert second.graph.step_time['plank'] == 0.5
+
+
+def test_unreadable_artifact_is_rebuilt(tmp_path):
+    key = domain_cache.domain_key(DATA)
+    (tmp_path / (key + '.pickle')).write_bytes(b'not a pickle')
+    assert domain_cache.load(DATA, str(tmp_path)).graph.order
+    assert domain_cache.load(DATA, str(tmp_path)).key == key
+
+
+def test_cached_domain_compiles_nothing_and_plans_the_same(tmp_path, monkeypatch):
+    domain_cache.load(DATA, str(tmp_path))
+    monkeypatch.setattr(codegen, 'code_cache', {})
+    cached = domain_cache.load(DATA, str(tmp_path))
+    size = len(codegen.code_cache)
+
+    data = dict(DATA, Goal={'cart': 1, 'rail': 10})
+    domain = autoHTN.make_domain(data, 'agent', compact=True, graph=cached.graph, compiled=True)
+    assert len(codegen.code_cache) == size
+    state = autoHTN.set_up_compact_state(data, ['agent'], time=300)
+    goals = autoHTN.set_up_goals(data, 'agent')
+    assert domain.pyhop(state, goals) == autoHTN.make_domain(data, 'agent', compact=True).pyhop(state, goals)
@@ -0,0 +1,55 @@
+import json
+import os
+
+import autoHTN
+import multiagent
+import pyhop
+from inventory import AgentColumns, item_index
+
+with open(os.path.join(os.path.dirname(__file__), 'crafting.json')) as f:
+    DATA = json.load(f)
+
+
+def plan_alone(data, ID, goal, time, initial=None):
+    data = dict(data, Goal=goal, Initial=initial if initial is not None else data['Initial'])
+    state = autoHTN.set_up_compact_state(data, [ID], time=time)
+    return autoHTN.make_domain(data, ID, compact=True).pyhop(state, autoHTN.set_up_goals(data, ID))
+
+
+def test_agent_columns_read_and_write_by_agent():
+    state = AgentColumns(item_index(DATA), ['a', 'b', 'c'])
+    state.wood = {'a': 2, 'c': 5}
+    assert state.wood['c'] == 5 and state.row('b') == (0,) * len(state.index)
+    state.assign(['b', 'c'], state.row('a'))
+    assert [state.wood[ID] for ID in 'abc'] == [2, 2, 2]
+    assert state.inventory('b')['wood'] == 2 and len(state.columns[0]) == 3
+
+
+def test_plan_agents_matches_planning_each_alone():
+    data = dict(DATA, Goal={'cart': 1, 'rail': 10})
+    agents = ['a{}'.format(n) for n in range(12)]
+    state = multiagent.set_up_agents(data, agents, time=300)
+    state.wood = {'a1': 4}
+    state.time = {'a2': 20}
+    goals = {ID: {'furnace': 1} for ID in agents[::3]}
+    assert len(multiagent.group_agents(state, goals, data['Goal'])) == 4
+
+    plans = multiagent.plan_agents(data, state, goals)
+    for ID in agents:
+        initial = {'wood': 4} if ID == 'a1' else {}
+        time = 20 if ID == 'a2' else 300
+        assert plans[ID] == plan_alone(data, ID, goals.get(ID, data['Goal']), time, initial)
+    assert plans['a2'] is False and state.time['a2'] == 20
+    assert state.rail['a4'] >= 10 and state.furnace['a3'] == 1
+    assert state.time['a4'] == 300 - sum(map(autoHTN.make_action_time(data), plans['a4']))
+
+
+def test_identical_agents_cost_one_search():
+    data = dict(DATA, Goal={'furnace': 1})
+    stats = pyhop.SearchStats()
+    multiagent.plan_agents(data, multiagent.set_up_agents(data, ['only'], time=300), stats=stats)
+    nodes = stats.nodes
+    stats = pyhop.SearchStats()
+    agents = ['a{}'.format(n) for n in range(200)]
+    plans = multiagent.plan_agents(data, multiagent.set_up_agents(data, agents, time=300), stats=stats, lifted=True)
+    assert stats.nodes < nodes and all(plan[0][1] == ID for ID, plan in plans.items())
@@ -0,0 +1,37 @@
+import json
+import os
+
+import pytest
+
+import autoHTN
+import parallel
+
+with open(os.path.join(os.path.dirname(__file__), 'crafting.json')) as f:
+    DATA = json.load(f)
+
+
+@pytest.mark.parametrize('goal, time, levels', [({'furnace': 1}, 300, 1), ({'cart': 1, 'rail': 20}, 300, 2),
+                                                ({'iron_pickaxe': 1}, 90, 2), ({'wooden_pickaxe': 1}, 5, 1)])
+def test_plan_parallel_matches_sequential(goal, time, levels):
+    data = dict(DATA, Goal=goal)
+    state = autoHTN.set_up_compact_state(data, ['agent'], time=time)
+    expected = autoHTN.make_domain(data, 'agent', compact=True).pyhop(state, autoHTN.set_up_goals(data, 'agent'))
+    assert parallel.plan_parallel(data, 'agent', time, workers=2, levels=levels) == expected
+
+
+@pytest.mark.parametrize('goal', [{'wooden_pickaxe': 1}, {'wood': 12}])
+def test_plan_parallel_cheapest_matches_optimal(goal):
+    data = dict(DATA, Goal=goal)
+    state = autoHTN.set_up_compact_state(data, ['agent'], time=300)
+    domain = autoHTN.make_domain(data, 'agent', compact=True)
+    expected = domain.pyhop_optimal(state, autoHTN.set_up_goals(data, 'agent'), autoHTN.make_action_time(data),
+                                    autoHTN.make_time_bound(data, 'agent'))
+    assert parallel.plan_parallel(data, 'agent', 300, workers=2, cost=True) == expected[0]
+
+
+def test_decide_waits_for_earlier_subtrees():
+    assert parallel._decide({1: ['b']}, 3) is None
+    assert parallel._decide({0: False, 1: ['b'], 2: None}, 3) == ['b']
+    assert parallel._decide({0: False, 1: False, 2: False}, 3) is False
+    assert parallel._decide({0: ['a', 'a'], 1: ['b']}, 3, len) is None
+    assert parallel._decide({0: ['a', 'a'], 1: ['b'], 2: ['c']}, 3, len) == ['b']
@@ -0,0 +1,82 @@
+import json
+import os
+
+import plan_cache
+import simulator
+
+with open(os.path.join(os.path.dirname(__file__), 'crafting.json')) as f:
+    DATA = json.load(f)
+
+
+def valid(plan, initial, goal, time, ID='agent'):
+    return simulator.Simulator(dict(DATA, Initial=initial, Goal=goal), [ID]).replay(plan, time)['valid']
+
+
+def test_canonical_ignores_order_and_zeros_of_initial():
+    assert plan_cache.canonical({'wood': 1, 'plank': 0, 'bench': 1}, {'rail': 2}) == \
+        plan_cache.canonical({'bench': 1, 'wood': 1}, {'rail': 2})
+    assert plan_cache.canonical({}, {'rail': 2, 'cart': 1}) != plan_cache.canonical({}, {'cart': 1, 'rail': 2})
+
+
+def test_budgets_between_spent_and_searched_hit():
+    cache = plan_cache.PlanCache(DATA, splice=False)
+    plan = cache.plan({}, {'iron_pickaxe': 1}, 300, ID='bob')
+    assert plan and all(task[1] == 'bob' for task in plan) and valid(plan, {}, {'iron_pickaxe': 1}, 300, 'bob')
+    spent = cache.plans[plan_cache.canonical({}, {'iron_pickaxe': 1})][0][1]
+
+    assert cache.plan({'plank': 0}, {'iron_pickaxe': 1}, spent) == [(task[0], 'agent') for task in plan]
+    assert cache.stats()['hits'] == 1
+    cache.plan({}, {'iron_pickaxe': 1}, 400)
+    assert cache.plan({}, {'wooden_pickaxe': 1}, 10) is False
+    assert cache.plan({}, {'wooden_pickaxe': 1}, 5) is False
+    assert (cache.hits, cache.misses) == (2, 3)
+
+
+def test_shared_subgoals_are_spliced_in():
+    cache = plan_cache.PlanCache(DATA)
+    first = cache.plan({}, {'iron_pickaxe': 1}, 300)
+    assert cache.splices == 0 and cache.stats()['subplans'] > 0
+    plan = cache.plan({}, {'iron_pickaxe': 1, 'rail': 10}, 300)
+    assert cache.splices > 0 and plan[:len(first)] == first
+    assert valid(plan, {}, {'iron_pickaxe': 1, 'rail': 10}, 300)
+
+
+def test_least_recently_used_requests_are_evicted():
+    cache = plan_cache.PlanCache(DATA, maxsize=2, splice=False)
+    for goal in ({'stick': 1}, {'plank': 1}, {'stick': 1}, {'wood': 1}):
+        cache.plan({}, goal, 10)
+    assert list(cache.plans) == [plan_cache.canonical({}, {'stick': 1}), plan_cache.canonical({}, {'wood': 1})]
+    assert cache.evictions == 1
+
+
+def test_answers_per_request_are_merged_and_bounded():
+    cache = plan_cache.PlanCache(DATA, maxsize=3, splice=False)
+    key = plan_cache.canonical({}, {'wooden_pickaxe': 1})
+    for time in range(5, 16):
+        assert cache.plan({}, {'wooden_pickaxe': 1}, time) is False
+    # Each failure covers the ones with less time before it
+    assert cache.plans[key] == [(15, None, False)] and cache.answers == 1
+    assert cache.plan({}, {'wooden_pickaxe': 1}, 300)
+    assert cache.plan({}, {'wooden_pickaxe': 1}, 400) and len(cache.plans[key]) == 2
+
+    cache.plan({}, {'stick': 1}, 10)
+    cache.plan({}, {'wood': 1}, 10)
+    assert cache.answers == 3 == sum(map(len, cache.plans.values())) and cache.evictions == 1
+    # The oldest answer of the least recently used request went first
+    assert [budget for budget, spent, plan in cache.plans[key]] == [400]
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'plans.pickle')
+    cache = plan_cache.PlanCache(DATA)
+    assert not cache.load(path)
+    cache.plan({}, {'furnace': 1}, 300)
+    cache.save(path)
+
+    other = plan_cache.PlanCache(DATA)
+    assert other.load(path) and other.plans == cache.plans and other.subplans == cache.subplans
+    assert other.plan({}, {'furnace': 1}, 300) and other.hits == 1
+
+    recipes = dict(DATA['Recipes'])
+    del recipes['punch for wood']
+    assert not plan_cache.PlanCache(dict(DATA, Recipes=recipes)).load(path)
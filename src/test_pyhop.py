@@ -0,0 +1,435 @@
+import concurrent.futures
+import copy
+import json
+import os
+
+import pytest
+
+import autoHTN
+import benchmark
+import pyhop
+
+with open(os.path.join(os.path.dirname(__file__), 'crafting.json')) as f:
+    DATA = json.load(f)
+
+
+def problem(goal, mode='deepcopy', time=300):
+    data = copy.deepcopy(DATA)
+    data['Goal'] = goal
+    return benchmark.set_up(data, 'agent', mode, time), autoHTN.set_up_goals(data, 'agent')
+
+
+@pytest.mark.parametrize('goal', benchmark.GOALS + [{'rail': 5, 'iron_axe': 1}])
+@pytest.mark.parametrize('mode', ['deepcopy', 'undo', 'compact'])
+def test_iterative_matches_recursive(goal, mode):
+    state, goals = problem(goal, mode)
+    expected = pyhop.seek_plan(copy.deepcopy(state), goals, [], 0)
+    assert expected
+    assert pyhop.seek_plan_iterative(copy.deepcopy(state), goals) == expected
+    assert pyhop.pyhop(state, goals) == expected
+
+
+def test_iterative_has_no_depth_ceiling():
+    state, goals = problem({'wood': 500}, time=5000)
+    plan = pyhop.pyhop(state, goals)
+    assert plan and len(plan) > 500
+
+
+def test_iterative_failure():
+    state, goals = problem({'wooden_pickaxe': 1}, time=5)
+    assert pyhop.pyhop(state, goals) is False
+
+
+def test_undo_state_rolls_back_attributes():
+    state = pyhop.UndoState('s')
+    state.loc = {'a': 1}
+    mark = state.mark()
+    state.new = {'a': 2}
+    state.loc = {'a': 3}
+    del state.loc
+    state.rollback(mark)
+    assert vars(state) == {'__name__': 's', 'loc': {'a': 1}}
+
+
+def test_undo_state_rolls_back_nested_writes():
+    state = pyhop.UndoState('s')
+    state.dist = {'home': {'park': 8}}
+    mark = state.mark()
+    state.dist['home']['park'] = 2
+    state.dist['home']['shop'] = 5
+    state.dist['park'] = {'home': 8}
+    del state.dist['home']
+    state.rollback(mark)
+    assert state.dist == {'home': {'park': 8}}
+
+
+@pytest.mark.parametrize('change', [
+    lambda loc: loc.update({'a': 5, 'b': 2}, c=3),
+    lambda loc: loc.update([('a', {'x': 1})]),
+    lambda loc: loc.pop(next(iter(loc))),
+    lambda loc: loc.pop('z', None),
+    lambda loc: loc.setdefault('c', 3),
+    lambda loc: loc.setdefault('a', 3),
+    lambda loc: loc.popitem(),
+    lambda loc: loc.clear(),
+    lambda loc: loc.__ior__({'a': 0, 'd': 4}),
+])
+def test_undo_state_rolls_back_every_dict_method(change):
+    state = pyhop.UndoState('s')
+    state.loc = {'a': 1, 'n': {'b': 2}}
+    mark = state.mark()
+    change(state.loc['n'])
+    change(state.loc)
+    state.rollback(mark)
+    assert state.loc == {'a': 1, 'n': {'b': 2}}
+
+
+def test_undo_state_dict_methods_return_what_dict_does():
+    state = pyhop.UndoState('s')
+    state.loc = {'a': 1, 'b': 2}
+    assert state.loc.pop('a') == 1 and state.loc.pop('a', 7) == 7 and state.loc.setdefault('b', 5) == 2
+    assert state.loc.popitem() == ('b', 2)
+    with pytest.raises(KeyError):
+        state.loc.pop('a')
+    with pytest.raises(KeyError):
+        state.loc.popitem()
+    state.loc.update(c={'d': 1})
+    assert type(state.loc['c']) is pyhop._LoggedDict
+
+
+def test_undo_state_deepcopy_is_plain():
+    state = pyhop.UndoState('s')
+    state.dist = {'home': {'park': 8}}
+    new = copy.deepcopy(state)
+    assert isinstance(new, pyhop.UndoState) and new.mark() == 0
+    assert type(new.dist) is pyhop._LoggedDict and new.dist._journal is new._journal
+    assert type(pyhop._plain(new.dist)['home']) is dict
+    new.dist['home']['park'] = 1
+    assert state.dist['home']['park'] == 8
+    assert type(copy.deepcopy(state.dist)['home']) is dict
+
+
+def test_pyhop_restores_undo_state_on_error():
+    state, goals = problem({'furnace': 1}, 'undo')
+    before = copy.deepcopy(state)
+
+    def explode(state, curr_task, tasks, plan, depth, calling_stack):
+        if depth > 20:
+            raise RuntimeError
+    pyhop.add_check(explode)
+    try:
+        with pytest.raises(RuntimeError):
+            pyhop.pyhop(state, goals)
+    finally:
+        pyhop.checks.remove(explode)
+    assert vars(state) == vars(before)
+
+
+@pytest.mark.parametrize('mode', ['deepcopy', 'undo', 'compact'])
+def test_state_key_is_canonical(mode):
+    state, goals = problem({'furnace': 1}, mode)
+    new = copy.deepcopy(state)
+    assert pyhop.state_key(new) == pyhop.state_key(state)
+    new.wood['agent'] = 1
+    assert pyhop.state_key(new) != pyhop.state_key(state)
+
+
+@pytest.mark.parametrize('with_stack', [False, True])
+@pytest.mark.parametrize('goal', benchmark.GOALS)
+def test_memo_keeps_plans(goal, with_stack):
+    state, goals = problem(goal, 'compact')
+    memo = pyhop.Memo(solutions=True, with_stack=with_stack)
+    expected = pyhop.pyhop(state, goals)
+    assert pyhop.pyhop(state, goals, memo=memo) == expected
+    assert memo.hits == 0
+    # Every node on the way to the plan is now solved
+    assert pyhop.pyhop(state, goals, memo=memo) == expected
+    assert memo.hits == 1
+
+
+def test_memo_cuts_failed_subproblems():
+    state, goals = problem({'furnace': 1}, 'compact', time=25)
+    memo = pyhop.Memo()
+    assert pyhop.pyhop(state, goals, memo=memo) is False
+    assert memo.hits > 0 and 0 < memo.hit_rate() < 1
+    assert memo.stats()['size'] == len(memo.table)
+
+
+def test_memo_evicts_least_recently_used():
+    memo = pyhop.Memo(maxsize=2)
+    memo.record('a', pyhop.FAILED)
+    memo.record('b', pyhop.FAILED)
+    assert memo.lookup('a') is pyhop.FAILED
+    memo.record('c', pyhop.FAILED)
+    assert list(memo.table) == ['a', 'c'] and memo.evictions == 1
+    assert memo.lookup('b') is None and memo.misses == 1
+
+
+def test_domains_do_not_share_checks():
+    data = copy.deepcopy(DATA)
+    data['Goal'] = {'furnace': 1}
+    goals = autoHTN.set_up_goals(data, 'agent')
+    domain = autoHTN.make_domain(data, 'agent', compact=True)
+    state = autoHTN.set_up_compact_state(data, ['agent'], time=300)
+    expected = domain.pyhop(state, goals)
+    assert expected
+
+    # Same tables, but a check that cuts everything below the first task
+    blocked = pyhop.Domain('blocked', domain.operators, domain.methods)
+    blocked.add_check(lambda state, curr_task, tasks, plan, depth, calling_stack: depth > 0)
+    assert blocked.pyhop(state, goals) is False
+    assert domain.pyhop(state, goals) == expected
+    assert domain.checks is not pyhop.checks and blocked.checks is not domain.checks
+
+
+def test_domains_plan_side_by_side_in_threads():
+    plans = {}
+    for goal in benchmark.GOALS[:3]:
+        data = copy.deepcopy(DATA)
+        data['Goal'] = goal
+        domain = autoHTN.make_domain(data, 'agent', compact=True)
+        state = autoHTN.set_up_compact_state(data, ['agent'], time=300)
+        goals = autoHTN.set_up_goals(data, 'agent')
+        plans[domain] = (state, goals, domain.pyhop(state, goals))
+    with concurrent.futures.ThreadPoolExecutor(3) as pool:
+        results = {domain: pool.submit(domain.pyhop, state, goals) for domain, (state, goals, _) in plans.items()}
+    for domain, (_, _, expected) in plans.items():
+        assert results[domain].result() == expected
+
+
+@pytest.mark.parametrize('mode', ['deepcopy', 'undo', 'compact'])
+def test_anytime_search_resumes_to_the_same_plan(mode):
+    state, goals = problem({'cart': 1, 'rail': 20}, mode)
+    before = copy.deepcopy(state)
+    expected = pyhop.pyhop(state, goals)
+
+    search = pyhop.AnytimeSearch(state, goals)
+    assert search.run(seconds=0)['status'] == pyhop.BUDGET_EXHAUSTED and search.nodes == 0
+    results = []
+    while not search.done():
+        results.append(search.run(max_nodes=50))
+    assert len(results) > 2 and all(r['status'] == pyhop.BUDGET_EXHAUSTED and r['plan'] is False for r in results[:-1])
+    assert results[-1]['status'] == pyhop.SOLVED and results[-1]['plan'] == expected
+    assert results[-1]['nodes'] == search.nodes <= 50 * len(results)
+    assert vars(state) == vars(before) if mode != 'compact' else state == before
+
+
+def test_anytime_search_keeps_best_plan_so_far():
+    state, goals = problem({'wood': 12}, 'compact')
+    data = dict(DATA, Goal={'wood': 12})
+    action_time = autoHTN.make_action_time(data)
+    bound = autoHTN.make_time_bound(data, 'agent')
+    expected = pyhop.pyhop_optimal(state, goals, action_time, bound)
+
+    search = pyhop.AnytimeSearch(state, goals, action_time, bound)
+    costs = []
+    while search.run(max_nodes=200)['status'] == pyhop.BUDGET_EXHAUSTED:
+        if search.cost is not None:
+            costs.append(search.cost)
+    assert costs == sorted(costs, reverse=True) and costs[0] > expected[1]
+    assert (search.plan, search.cost, search.nodes) == expected
+
+
+def test_anytime_search_fails_and_closes():
+    state, goals = problem({'wooden_pickaxe': 1}, 'undo', time=5)
+    assert pyhop.AnytimeSearch(state, goals).run()['status'] == pyhop.FAILED
+
+    state, goals = problem({'furnace': 1}, 'undo')
+    before = copy.deepcopy(state)
+    search = pyhop.AnytimeSearch(state, goals)
+    search.run(max_nodes=30)
+    assert vars(state) != vars(before)
+    search.close()
+    assert vars(state) == vars(before) and search.status == pyhop.BUDGET_EXHAUSTED
+    # A closed search isn't resumed, and doesn't claim there is no plan
+    nodes = search.nodes
+    assert search.run(max_nodes=30)['status'] == pyhop.BUDGET_EXHAUSTED and search.nodes == nodes
+    with pytest.raises(ValueError):
+        pyhop.AnytimeSearch(state, goals, action_cost=len, memo=pyhop.Memo())
+
+
+def test_anytime_search_is_closed_by_an_error():
+    data = dict(DATA, Goal={'iron_pickaxe': 1})
+    domain = autoHTN.make_domain(data, 'agent', compact=True)
+    state, goals = autoHTN.set_up_compact_state(data, ['agent'], time=300), autoHTN.set_up_goals(data, 'agent')
+    calls = []
+
+    def explode(state, curr_task, tasks, plan, depth, calling_stack):
+        calls.append(depth)
+        if len(calls) == 5:
+            raise RuntimeError('check failed')
+
+    domain.add_check(explode)
+    search = domain.anytime(state, goals)
+    with pytest.raises(RuntimeError):
+        search.run()
+    assert search.run()['status'] == pyhop.BUDGET_EXHAUSTED and not search.done() and search.plan is False
+
+
+def test_search_stats_counts_the_search():
+    state, goals = problem({'furnace': 1}, 'compact')
+    stats = pyhop.SearchStats(stacks=True)
+    assert pyhop.pyhop(state, goals, stats=stats) == pyhop.pyhop(state, goals)
+
+    counts = stats.as_dict()
+    assert counts == json.loads(stats.to_json())
+    assert stats.nodes > 0 and stats.nodes == sum(stats.stacks.values())
+    assert sum(stats.check_fires.values()) > 0 and set(stats.check_fires) == {'heuristic'}
+    assert all(stats.method_successes[name] <= n for name, n in stats.method_attempts.items())
+    assert stats.method_successes['compact_check_enough'] > 0
+    assert set(stats.operator_seconds) == set(stats.operator_calls) and all(t >= 0 for t in stats.operator_seconds.values())
+    assert stats.backtracks['produce'] > 0
+
+    lines = stats.folded().splitlines()
+    assert len(lines) == len(stats.stacks)
+    names, count = lines[0].rsplit(' ', 1)
+    assert names.split(';')[0] == 'have_enough' and int(count) > 0
+    with pytest.raises(ValueError):
+        pyhop.SearchStats().folded()
+
+
+def test_search_stats_matches_optimal_node_count():
+    data = dict(DATA, Goal={'wooden_pickaxe': 1})
+    state, goals = problem(data['Goal'], 'compact')
+    stats = pyhop.SearchStats()
+    plan, cost, nodes = pyhop.pyhop_optimal(state, goals, autoHTN.make_action_time(data), stats=stats)
+    assert stats.nodes == nodes
+    stats = pyhop.SearchStats()
+    domain = autoHTN.make_domain(data, 'agent', compact=True)
+    assert domain.pyhop_optimal(state, goals, autoHTN.make_action_time(data), stats=stats)[2] == stats.nodes > 0
+
+
+@pytest.mark.parametrize('levels', [1, 2, 3])
+@pytest.mark.parametrize('goal, time', [({'furnace': 1}, 300), ({'cart': 1, 'rail': 20}, 300), ({'wooden_pickaxe': 1}, 5)])
+def test_frontier_splits_the_search_in_order(goal, time, levels):
+    state, goals = problem(goal, 'compact', time)
+    expected = pyhop.pyhop(state, goals)
+    subproblems = pyhop.frontier(state, goals, levels)
+    assert len(subproblems) > 1
+
+    plan = False
+    for state, tasks, prefix, depth, calling_stack in subproblems:
+        plan = next(pyhop.iter_plans(state, tasks, start=(prefix, depth, calling_stack)), False)
+        if plan:
+            assert plan[:len(prefix)] == prefix
+            break
+    assert plan == expected
+
+
+def test_plan_steps_reads_like_a_list():
+    tasks = [('a', 1), ('b', 2), ('c', 3)]
+    plan = pyhop.PlanSteps.of(tasks)
+    shorter = plan.previous
+    assert len(plan) == 3 and plan[-1] == ('c', 3) and plan[0] == ('a', 1)
+    assert plan == tasks and list(plan) == tasks and plan != tasks[:2] and shorter == tasks[:2]
+    assert plan.since(1) == tasks[1:] and plan + [('d', 4)] == tasks + [('d', 4)]
+    assert plan.extend(('d', 4)).previous is plan and pyhop.EMPTY_PLAN.tolist() == []
+
+
+def stream(state, goals):
+    # Runs stream_plan to the end; returns (steps, return value, nodes searched when the first step came)
+    stats = pyhop.SearchStats()
+    steps, first = [], None
+    generator = pyhop.stream_plan(state, goals, stats=stats)
+    while True:
+        try:
+            steps.append(next(generator))
+        except StopIteration as stop:
+            return steps, stop.value, first, stats.nodes
+        if first is None:
+            first = stats.nodes
+
+
+@pytest.mark.parametrize('mode', ['deepcopy', 'undo', 'compact'])
+@pytest.mark.parametrize('goal', [{'furnace': 1}, {'cart': 1, 'rail': 20}])
+def test_stream_plan_generates_the_plan_early(goal, mode):
+    state, goals = problem(goal, mode)
+    before = copy.deepcopy(state)
+    expected = pyhop.pyhop(state, goals)
+    steps, plan, first, nodes = stream(state, goals)
+    assert steps == plan == expected
+    assert first < nodes / 2
+    assert vars(state) == vars(before) if mode != 'compact' else state == before
+
+
+def test_stream_plan_without_a_plan_returns_false():
+    state, goals = problem({'wooden_pickaxe': 1}, 'compact', time=5)
+    steps, plan, first, nodes = stream(state, goals)
+    assert plan is False
+    # Steps are only generated ahead of a failure; they are still the start of every plan there could have been
+    assert steps == [] or steps[0][0] == 'op_punch_for_wood'
+
+
+def test_memo_records_subplans_of_first_tasks():
+    state, goals = problem({'furnace': 1, 'rail': 2}, 'compact')
+    memo = pyhop.Memo(subplans=True)
+    plan = pyhop.pyhop(state, goals, memo=memo)
+    assert plan == pyhop.pyhop(state, goals)
+    furnace = memo.subplans[(pyhop.state_key(state), goals[0])]
+    assert furnace and plan[:len(furnace)] == furnace and furnace[-1][0] == 'op_craft_furnace_at_bench'
+    # The second goal started from wherever the first left off, and its steps are the rest of the plan
+    rails = [steps for (key, task), steps in memo.subplans.items() if task == goals[1]]
+    assert plan[len(furnace):] in rails
+    assert pyhop.Memo().subplans is None
+
+
+def test_agenda_keeps_pending_totals():
+    tasks = pyhop.Agenda.of([('have_enough', 'a', 'wood', 3), ('produce', 'a', 'wood'), ('have_enough', 'a', 'wood', 2)])
+    assert tasks.total('have_enough', 'a', 'wood') == 5 and tasks.total('have_enough', 'a', 'coal') == 0
+    child = tasks.after([('have_enough', 'a', 'coal', 1), ('op_punch_for_wood', 'a')])
+    assert child == [('have_enough', 'a', 'coal', 1), ('op_punch_for_wood', 'a')] + tasks[1:]
+    assert child.total('have_enough', 'a', 'wood') == 2 and child.total('have_enough', 'a', 'coal') == 1
+    assert tasks.total('have_enough', 'a', 'wood') == 5 and len(child) == 4 and child.rest.rest is tasks.rest
+    grandchild = child.after([])
+    assert grandchild.total('have_enough', 'a', 'wood') == 2 and grandchild.total('have_enough', 'a', 'coal') == 0
+    # The totals are shared: asking about an agenda again after another is still right
+    assert tasks.total('have_enough', 'a', 'wood') == 5 and child.total('have_enough', 'a', 'coal') == 1
+    assert pyhop.Agenda.of([]).tally is not pyhop.Agenda.of([]).tally
+
+
+def test_calling_stack_counts_tasks_in_any_order():
+    tasks = [('a',), ('b',), ('b',), ('c',), ('b',), ('b',), ('b',)]
+    stacks = [pyhop.CallingStack()]
+    for task in tasks:
+        stacks.append(stacks[-1].push(task))
+    top = stacks[-1]
+    assert top == tasks and len(top) == 7 and top[-1] == ('b',) and top[1:3] == tasks[1:3]
+    assert top + [('d',)] == tasks + [('d',)]
+    assert [stack.run for stack in stacks] == [0, 1, 1, 2, 1, 1, 2, 3]
+    # Asking about stacks out of order, on other branches, moves the counts there and back
+    branch = stacks[3].push(('d',))
+    for stack in (top, stacks[2], branch, stacks[5], stacks[0], top, branch):
+        expected = stack.tolist()
+        for task in (('a',), ('b',), ('c',), ('d',)):
+            assert stack.count(task) == expected.count(task) and (task in stack) == (task in expected)
+    assert pyhop.CallingStack.of(tasks) == top and pyhop.CallingStack().count(('a',)) == 0
+
+
+def test_domain_nogoods_persist_across_calls():
+    data = dict(DATA, Goal={'wooden_pickaxe': 1})
+    domain = autoHTN.make_domain(data, 'agent', compact=True)
+    domain.nogoods = pyhop.Nogoods()
+    state, goals = autoHTN.set_up_compact_state(data, ['agent'], time=8), autoHTN.set_up_goals(data, 'agent')
+    first, second = pyhop.SearchStats(), pyhop.SearchStats()
+    assert domain.pyhop(state, goals, stats=first) is False
+    assert domain.pyhop(state, goals, stats=second) is False
+    assert first.nodes > 1 and second.nodes == 1 and domain.nogoods.stats()['hits'] == 1
+    # Branch and bound cuts branches without them failing, so it learns nothing
+    size = len(domain.nogoods.table)
+    domain.pyhop_optimal(autoHTN.set_up_compact_state(data, ['agent'], time=20), goals, autoHTN.make_action_time(data))
+    assert len(domain.nogoods.table) == size
+
+
+def test_memo_keeps_nodes_of_plans_generated_when_enumerating():
+    data = dict(DATA, Initial={}, Goal={'wood': 1})
+    domain = autoHTN.make_domain(data, 'agent', compact=True)
+    state, goals = autoHTN.set_up_compact_state(data, ['agent'], time=300), autoHTN.set_up_goals(data, 'agent')
+    memo = pyhop.Memo()
+    plans = list(domain.iter_plans(state, goals, memo=memo))
+    assert len(plans) > 1
+    assert domain.pyhop(state, goals, memo=memo) == plans[0]
+
+
+def test_iter_plans_rejects_memo_with_prune():
+    with pytest.raises(ValueError):
+        pyhop.iter_plans(pyhop.State('s'), [], memo=pyhop.Memo(), prune=lambda *args: False)
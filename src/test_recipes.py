@@ -0,0 +1,63 @@
+import json
+import os
+
+from recipes import RecipeGraph, op_name
+
+with open(os.path.join(os.path.dirname(__file__), 'crafting.json')) as f:
+    DATA = json.load(f)
+
+GRAPH = RecipeGraph(DATA)
+
+
+def test_producers_fastest_first():
+    assert GRAPH.producers['wood'] == ['iron_axe for wood', 'stone_axe for wood', 'wooden_axe for wood',
+                                       'punch for wood']
+    for item, names in GRAPH.producers.items():
+        times = [DATA['Recipes'][name]['Time'] for name in names]
+        assert times == sorted(times)
+    assert 'craft stick' in GRAPH.consumers['plank'] and 'craft furnace at bench' in GRAPH.consumers['bench']
+
+
+def test_consume_order_is_topological():
+    # Every recipe's consumed items are gathered after the items made from them
+    position = {item: n for n, item in enumerate(GRAPH.consume_order)}
+    for rule in DATA['Recipes'].values():
+        for item in rule.get('Consumes', {}):
+            for made in rule['Produces']:
+                assert position[made] < position[item]
+    assert sorted(GRAPH.order) == sorted(GRAPH.consume_order)
+    assert [GRAPH.tiers[item] for item in GRAPH.order] == sorted(GRAPH.tiers.values())
+    assert GRAPH.tiers['wood'] == 1 and GRAPH.tiers['ingot'] > GRAPH.tiers['ore'] > GRAPH.tiers['cobble']
+
+
+def test_needs():
+    # Planks need wood, and wood can come from any of the axes
+    assert GRAPH.needs['plank'] == (frozenset(['craft plank'] + GRAPH.producers['wood']) | GRAPH.needs['iron_axe'] |
+                                    GRAPH.needs['stone_axe'] | GRAPH.needs['wooden_axe'])
+    assert GRAPH.needs['stick'] == GRAPH.needs['plank'] | {'craft stick'}
+    assert 'smelt ore in furnace' in GRAPH.needs['rail'] and 'craft rail at bench' not in GRAPH.needs['cart']
+
+
+def test_unit_values():
+    assert len(GRAPH.unit_values) == 2 ** len(DATA['Tools'])
+    assert GRAPH.unit_time('wood') == 4
+    assert GRAPH.unit_time('plank') == (1 + 4) / 4.0
+    assert GRAPH.unit_time('cobble') == float('inf')
+    assert GRAPH.unit_time('cobble', ['wooden_pickaxe']) == 4
+    assert GRAPH.unit_time('wood', DATA['Tools']) == 1
+    assert GRAPH.step_time['rail'] == 1 / 16.0 and GRAPH.most_produced['plank'] == 4
+    assert op_name('craft wooden_axe at bench') == 'op_craft_wooden_axe_at_bench'
+
+
+def test_relevant_recipes_and_items():
+    recipes, items = GRAPH.relevant({'cart': 1})
+    assert recipes == GRAPH.needs['cart'] and 'rail' not in items and {'cart', 'wood', 'iron_axe'} <= items
+
+    # 10 time can't pay for anything beyond a bench and a wooden axe
+    recipes, items = GRAPH.relevant({'stick': 1}, {}, 10)
+    assert items == {'stick', 'plank', 'wood', 'bench', 'wooden_axe'}
+    assert recipes == {'craft stick', 'craft plank', 'punch for wood', 'wooden_axe for wood',
+                       'craft wooden_axe at bench', 'craft bench'}
+    # Unless the tools are already held
+    assert 'iron_axe for wood' in GRAPH.relevant({'stick': 1}, {'iron_axe': 1}, 10)[0]
+    assert GRAPH.relevant({'stick': 1}, {}, 1000)[0] == GRAPH.needs['stick']
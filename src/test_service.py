@@ -0,0 +1,86 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import batch
+import service
+
+with open(os.path.join(os.path.dirname(__file__), 'crafting.json')) as f:
+    DATA = json.load(f)
+
+PROBLEMS = [
+    {'Goal': {'wooden_pickaxe': 1}, 'time': 300},
+    {'Goal': {'cart': 1, 'rail': 20}, 'time': 300},
+    {'Goal': {'wooden_pickaxe': 1}, 'time': 5},
+    {'Goal': {'furnace': 1}, 'Initial': {'cobble': 8, 'bench': 1}, 'time': 5, 'ID': 'miner'},
+]
+
+# About a tenth of a second of searching
+SLOW = {'Goal': {'wood': 3000}, 'time': 20000}
+
+
+def run(workers, requests):
+    # Runs requests(service) in a fresh event loop against a fresh service; returns its result and the service's stats
+    async def main():
+        async with service.PlanningService(DATA, workers) as planner:
+            return await requests(planner), planner.stats()
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_service_plans_like_batch(workers):
+    plans, stats = run(workers, lambda planner: asyncio.gather(*(planner.plan(problem) for problem in PROBLEMS)))
+    assert plans == [plan for index, plan in sorted(batch.plan_batch(PROBLEMS, rules=DATA))]
+    assert stats == {'searches': 4, 'coalesced': 0, 'timeouts': 0, 'running': 0}
+
+
+def test_identical_requests_share_one_search():
+    same = [dict(PROBLEMS[1], Initial={'wood': 0}), PROBLEMS[1], dict(PROBLEMS[1], ID='agent')]
+    plans, stats = run(None, lambda planner: asyncio.gather(*(planner.plan(problem) for problem in same * 3)))
+    assert all(plan == plans[0] for plan in plans) and len(set(map(id, plans))) == len(plans)
+    assert stats['searches'] == 1 and stats['coalesced'] == 8
+
+
+@pytest.mark.parametrize('workers', [None, 1])
+def test_request_with_a_later_deadline_does_not_join_a_shorter_search(workers):
+    async def requests(planner):
+        short = asyncio.ensure_future(planner.plan(SLOW, deadline=0.01))
+        await asyncio.sleep(0)
+        joined = await asyncio.gather(short, planner.plan(SLOW), planner.plan(SLOW, deadline=60),
+                                      return_exceptions=True)
+        return [type(plan) if isinstance(plan, BaseException) else len(plan) for plan in joined]
+
+    (short, unlimited, later), stats = run(workers, requests)
+    assert short is asyncio.TimeoutError and unlimited > 3000 and later == unlimited
+    # The request without a deadline starts its own search, which the one with a later deadline joins
+    assert stats['searches'] == 2 and stats['coalesced'] == 1 and stats['timeouts'] == 1
+
+
+@pytest.mark.parametrize('workers', [None, 1])
+def test_deadline_stops_the_search(workers):
+    async def requests(planner):
+        with pytest.raises(asyncio.TimeoutError):
+            await planner.plan(SLOW, deadline=0.01)
+        # Nothing is left running, and the service still plans
+        assert planner.stats()['running'] == 0
+        return await planner.plan(PROBLEMS[0], deadline=60)
+
+    plan, stats = run(workers, requests)
+    assert plan[-1] == ('op_craft_wooden_pickaxe_at_bench', 'agent')
+    assert stats['timeouts'] == 1 and stats['searches'] == 2
+
+
+def test_event_loop_keeps_running_during_a_search():
+    async def requests(planner):
+        ticks = 0
+        search = asyncio.ensure_future(planner.plan(SLOW))
+        while not search.done():
+            await asyncio.sleep(0.001)
+            ticks += 1
+        return len(await search), ticks
+
+    (length, ticks), stats = run(1, requests)
+    assert length > 3000 and ticks > 10
@@ -0,0 +1,61 @@
+import json
+import os
+
+import pytest
+
+import autoHTN
+import simulator
+
+with open(os.path.join(os.path.dirname(__file__), 'crafting.json')) as f:
+    DATA = json.load(f)
+
+
+def plan_for(goal, time=300, lifted=False):
+    data = dict(DATA, Goal=goal)
+    state = autoHTN.set_up_compact_state(data, ['agent'], time=time)
+    return data, autoHTN.make_domain(data, 'agent', compact=True, lifted=lifted).pyhop(state, autoHTN.set_up_goals(data, 'agent'))
+
+
+@pytest.mark.parametrize('lifted', [False, True])
+@pytest.mark.parametrize('goal', [{'furnace': 1}, {'cart': 1, 'rail': 20}, {'iron_pickaxe': 1}])
+def test_replay_accepts_planned_plans(goal, lifted):
+    data, plan = plan_for(goal, lifted=lifted)
+    result = simulator.Simulator(data).replay(plan, 300)
+    assert result['valid'] and result['step'] is None and result['reason'] is None
+    assert len(result['times']) == len(plan) and result['times'] == sorted(result['times'], reverse=True)
+    spent = sum(map(autoHTN.make_action_time(data), plan))
+    assert result['inventory']['agent']['time'] == result['times'][-1] == 300 - spent
+    assert all(result['inventory']['agent'][item] >= num for item, num in goal.items())
+
+
+def test_replay_says_which_step_fails_and_why():
+    data, plan = plan_for({'cart': 1, 'rail': 20})
+    replay = simulator.Simulator(data).replay
+    assert replay(plan[1:], 300)['reason'] == 'op_craft_plank needs 1 wood but agent has 0'
+    assert replay(plan[:-1], 300)['reason'] == 'agent ends with 16 rail but the goal is 20'
+    result = replay(plan, 100)
+    assert not result['valid'] and result['step'] == len(result['times']) and result['inventory']['agent']['time'] < 5
+    assert replay([('op_fly', 'agent')])['reason'] == 'there is no recipe for op_fly'
+    assert replay([('op_punch_for_wood', 'someone')], 10)['step'] == 0
+
+    data, lifted = plan_for({'cart': 1, 'rail': 20}, lifted=True)
+    assert replay(lifted, 150)['reason'] == 'op_iron_pickaxe_for_ore needs 2 time but agent has 1 (run 6 of 12)'
+
+
+def test_replay_all_matches_replay():
+    data, plan = plan_for({'furnace': 1})
+    sim = simulator.Simulator(data)
+    plans = [plan, plan[:-1], plan[1:]]
+    assert sim.replay_all(plans, 300) == [sim.replay(p, 300) for p in plans]
+    assert [result['valid'] for result in sim.replay_all(plans, 300)] == [True, False, False]
+
+
+def test_main_checks_a_file_of_plans(tmp_path):
+    data, plan = plan_for({'furnace': 1})
+    rules = tmp_path / 'crafting.json'
+    rules.write_text(json.dumps(data))
+    plans = tmp_path / 'plans.json'
+    plans.write_text(json.dumps([plan]))
+    assert simulator.main([str(plans), '--rules', str(rules)]) == 0
+    plans.write_text(json.dumps([plan, plan[1:]]))
+    assert simulator.main([str(plans), '--rules', str(rules)]) == 1